@@ -4,7 +4,7 @@ from geonature.core.admin.admin import admin
 from geonature.core.admin.utils import CruvedProtectedMixin
 from geonature.utils.env import db
 
-from api2gn.models import ParserModel
+from api2gn.models import DeadLetterModel, ParserModel, ParserRunModel
 
 
 class Api2GNAdmin(ModelView):
@@ -16,6 +16,7 @@ class Api2GNAdmin(ModelView):
         "last_import",
         "nb_row_total",
         "nb_row_last_import",
+        "last_import_duration",
         "schedule_frequency",
     )
     column_labels = dict(
@@ -24,6 +25,7 @@ class Api2GNAdmin(ModelView):
         last_import="Dernier import",
         nb_row_total="Nombre total importé",
         nb_row_last_import="Nombre au dernier import",
+        last_import_duration="Durée du dernier import (s)",
         schedule_frequency="Fréquence de MAJ (en jour)",
     )
     form_columns = (
@@ -32,4 +34,101 @@ class Api2GNAdmin(ModelView):
     )
 
 
+class ParserRunAdmin(ModelView):
+    module_code = "ADMIN"
+    object_code = "PARSER"
+    can_create = False
+    can_edit = False
+    column_default_sort = ("start_date", True)
+    column_filters = ("parser.name", "dry_run", "start_date")
+    column_list = (
+        "parser.name",
+        "start_date",
+        "duration",
+        "nb_row_imported",
+        "rows_per_second",
+        "http_duration",
+        "parse_duration",
+        "build_duration",
+        "write_duration",
+        "nb_pages",
+        "nb_bytes",
+        "nb_retries",
+        "nb_row_skipped",
+        "nb_cache_hits",
+        "nb_row_rejected",
+        "nb_row_duplicated",
+        "dry_run",
+    )
+    column_labels = {
+        "parser.name": "Parser",
+        "start_date": "Début",
+        "duration": "Durée (s)",
+        "nb_row_imported": "Lignes importées",
+        "rows_per_second": "Lignes / s",
+        "http_duration": "HTTP (s)",
+        "parse_duration": "Décodage (s)",
+        "build_duration": "Construction (s)",
+        "write_duration": "Écriture (s)",
+        "nb_pages": "Pages",
+        "nb_bytes": "Octets téléchargés",
+        "nb_retries": "Nouvelles tentatives",
+        "nb_row_skipped": "Lignes ignorées",
+        "nb_cache_hits": "Réponses en cache",
+        "nb_row_rejected": "Lignes rejetées",
+        "nb_row_duplicated": "Doublons écartés",
+        "dry_run": "Essai (dry-run)",
+    }
+    column_formatters = {
+        col: lambda v, c, m, p: round(getattr(m, p), 2)
+        if getattr(m, p) is not None
+        else None
+        for col in (
+            "duration",
+            "rows_per_second",
+            "http_duration",
+            "parse_duration",
+            "build_duration",
+            "write_duration",
+        )
+    }
+
+
+class DeadLetterAdmin(ModelView):
+    module_code = "ADMIN"
+    object_code = "PARSER"
+    can_create = False
+    can_edit = False
+    column_default_sort = ("create_date", True)
+    column_filters = ("parser.name", "stage", "run_uuid")
+    column_list = ("parser.name", "create_date", "stage", "error", "payload")
+    column_labels = {
+        "parser.name": "Parser",
+        "create_date": "Date",
+        "stage": "Étape",
+        "error": "Erreur",
+        "payload": "Donnée source",
+        "synthese_values": "Valeurs Synthèse",
+        "run_uuid": "Import",
+    }
+
+
 admin.add_view(Api2GNAdmin(ParserModel, db.session, category="Api2GN", name="Parsers"))
+admin.add_view(
+    ParserRunAdmin(
+        ParserRunModel,
+        db.session,
+        category="Api2GN",
+        name="Historique des imports",
+        endpoint="parser_run",
+    )
+)
+admin.add_view(
+    DeadLetterAdmin(
+        DeadLetterModel,
+        db.session,
+        category="Api2GN",
+        name="Lignes rejetées",
+        endpoint="dead_letter",
+    )
+)
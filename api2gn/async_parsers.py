@@ -0,0 +1,323 @@
+"""
+Asyncio variants of the parsers for high latency sources: the pages are
+fetched concurrently with httpx (optional dependency) in an event loop
+running in a background thread, while `run` builds and writes the rows of
+the previous pages in the main thread.
+
+A parser opts in by inheriting from `AsyncJSONParser` or `AsyncWFSParser`
+(ex: `class MyParser(AsyncJSONParser, GeoNatureParser)`), its mapping is
+unchanged.
+"""
+import asyncio
+import queue
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections import deque
+
+import click
+
+from geonature.utils.config import config
+
+from api2gn.gml import local_name
+from api2gn.parsers import JSONParser, WFSParser
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+module_config = config["API2GN"]
+
+_END = object()
+
+
+class AsyncParserMixin:
+    """
+    The subclasses implement `apages(page)`: an async generator of
+    (page number, list of rows, cursor of the next page) from `page`,
+    in order
+    """
+
+    # number of requests in flight (PARSER_ASYNC_CONCURRENCY if not set)
+    concurrency: int = None
+    _async_client = None
+
+    @property
+    def max_concurrency(self):
+        return max(self.concurrency or module_config["PARSER_ASYNC_CONCURRENCY"], 1)
+
+    def check_cache(self):
+        """
+        The async requests do not go through the response cache: it is
+        bypassed, and there is nothing to replay with `from_cache`
+        """
+        if self.from_cache:
+            raise click.ClickException(
+                f"The async parser {self.name} does not support --from-cache"
+            )
+        if self.response_cache is not None:
+            click.secho(
+                f"The async parser {self.name} does not use the response cache",
+                fg="yellow",
+            )
+
+    def async_client(self):
+        if httpx is None:
+            raise click.ClickException(
+                f"The parser {self.name} needs httpx (pip install httpx)"
+            )
+        self._async_client = httpx.AsyncClient(
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=self.max_concurrency),
+            timeout=httpx.Timeout(
+                module_config["PARSER_HTTP_READ_TIMEOUT"],
+                connect=module_config["PARSER_HTTP_CONNECT_TIMEOUT"],
+            ),
+        )
+        return self._async_client
+
+    async def arequest_or_retry(self, url, **kwargs):
+        nb_tries = module_config["PARSER_NUMBER_OF_TRIES"]
+        assert nb_tries > 0
+        response = None
+        for attempt in range(nb_tries):
+            if attempt:
+                self.stats.incr("nb_retries")
+                self.metrics.retry()
+                await asyncio.sleep(self.retry_delay(attempt))
+            start = time.perf_counter()
+            try:
+                response = await self._async_client.get(url, **kwargs)
+            except httpx.TransportError as e:
+                self.metrics.observe_http(time.perf_counter() - start, "error")
+                click.secho(f"Failed to fetch url {url} ({e}). Retrying ...", fg="yellow")
+                continue
+            finally:
+                self.stats.add_time("http", time.perf_counter() - start)
+            self.metrics.observe_http(
+                time.perf_counter() - start, response.status_code
+            )
+            if response.status_code == 200:
+                self.stats.incr("nb_pages")
+                self.stats.incr("nb_bytes", len(response.content))
+                return response
+            if response.status_code not in module_config["PARSER_RETRY_HTTP_STATUS"]:
+                break
+            click.secho("Failed to fetch url {}. Retrying ...".format(url), fg="yellow")
+        status_code = response.status_code if response is not None else None
+        click.secho(
+            "Failed to fetch {} after {} times. Status code : {}.".format(
+                url, attempt + 1, status_code
+            ),
+            fg="red",
+        )
+        raise click.ClickException(
+            ("Failed to download {url}. HTTP status code {status_code}").format(
+                url=response.url if response is not None else url,
+                status_code=status_code,
+            )
+        )
+
+    async def ordered_fetches(self, fetch, keys):
+        """
+        Run `fetch(key)` for the keys of the iterable `keys` with at most
+        `max_concurrency` requests in flight and yield (key, result) in
+        order. Stop the iteration with `aclose()`
+        """
+        keys = iter(keys)
+        tasks = deque()
+        try:
+            while True:
+                while len(tasks) < self.max_concurrency:
+                    key = next(keys, _END)
+                    if key is _END:
+                        break
+                    tasks.append((key, asyncio.ensure_future(fetch(key))))
+                if not tasks:
+                    return
+                key, task = tasks.popleft()
+                yield key, await task
+        finally:
+            for _, task in tasks:
+                task.cancel()
+
+    async def anext_row(self, page=0):
+        """
+        Async generator of the rows, as `next_row`. The pages are not
+        marked as done (no checkpoint)
+        """
+        self.check_cache()
+        async with self.async_client():
+            async for _, rows, _ in self.apages(page):
+                for row in rows:
+                    yield row
+
+    def put_until(self, pages, item, cancelled):
+        """
+        Put `item` in the queue unless the consumer stopped
+        """
+        while not cancelled.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce_pages(self, page, pages, cancelled):
+        """
+        Run the event loop fetching the pages (in the producer thread)
+        """
+
+        async def produce():
+            loop = asyncio.get_running_loop()
+            async with self.async_client():
+                async for item in self.apages(page):
+                    if not await loop.run_in_executor(
+                        None, self.put_until, pages, item, cancelled
+                    ):
+                        return
+
+        try:
+            asyncio.run(produce())
+        except BaseException as e:
+            self.put_until(pages, e, cancelled)
+        else:
+            self.put_until(pages, _END, cancelled)
+
+    def next_row(self, page=0):
+        """
+        Sync bridge used by `run` and the Celery tasks: the pages are fetched
+        in a background thread and at most `max_concurrency` fetched pages
+        wait in memory. Rows are built and written in the calling thread
+        """
+        self.check_cache()
+        pages = queue.Queue(maxsize=self.max_concurrency)
+        cancelled = threading.Event()
+        producer = threading.Thread(
+            target=self.produce_pages, args=(page, pages, cancelled), daemon=True
+        )
+        producer.start()
+        try:
+            while True:
+                item = pages.get()
+                if item is _END:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                current_page, rows, cursor = item
+                yield from rows
+                self.page_done(current_page, len(rows), cursor)
+        finally:
+            cancelled.set()
+            producer.join()
+
+
+class AsyncJSONParser(AsyncParserMixin, JSONParser):
+    async def afetch_page(self, page, cursor=None):
+        url, params = self.paginator.request(self, page, cursor)
+        return self.decode_json(await self.arequest_or_retry(url, params=params))
+
+    async def follow_pages(self, page=0):
+        """
+        Pages of the keyset and next link paginations: each page is
+        requested from the previous one
+        """
+        cursor = self.start_cursor(page)
+        while self.end_page is None or page < self.end_page:
+            self.root = await self.afetch_page(page, cursor)
+            items = self.items
+            next_cursor = self.paginator.next_cursor(self, self.root, items)
+            yield page, self.paginator.filter_items(items, cursor), next_cursor
+            if self.paginator.is_last_page(self, len(items), cursor, next_cursor):
+                return
+            page += 1
+            cursor = next_cursor
+
+    async def apages(self, page=0):
+        if not self.paginator.random_access:
+            async for item in self.follow_pages(page):
+                yield item
+            return
+        if self.end_page is not None and page >= self.end_page:
+            return
+        self.root = await self.afetch_page(page)
+        last_page = self.get_last_page()
+        items = self.items
+        yield page, items, None
+        if len(items) < self.limit:
+            return
+
+        def next_pages():
+            next_page = page + 1
+            while last_page is None or next_page <= last_page:
+                yield next_page
+                next_page += 1
+
+        fetches = self.ordered_fetches(self.afetch_page, next_pages())
+        try:
+            async for current_page, root in fetches:
+                self.root = root
+                items = self.items
+                yield current_page, items, None
+                if len(items) < self.limit:
+                    return
+        finally:
+            await fetches.aclose()
+
+
+class AsyncWFSParser(AsyncParserMixin, WFSParser):
+    def parse_features(self, content):
+        with self.stats.timer("parse"):
+            return [
+                member
+                for member in ET.fromstring(content)
+                if local_name(member.tag) != "boundedBy"
+            ]
+
+    async def afetch_features(self, start_index=None, count=None):
+        response = await self.arequest_or_retry(
+            self.url, params=self.get_feature_filters(start_index, count)
+        )
+        return self.parse_features(response.content)
+
+    async def ahits(self):
+        response = await self.arequest_or_retry(
+            self.url, params={**self.get_feature_filters(), "resultType": "hits"}
+        )
+        return self.parse_hits(response.content)
+
+    async def apages(self, page=0):
+        if not self.paging_enabled:
+            if not page:
+                yield 0, await self.afetch_features(count=self.limit), None
+            return
+
+        total = await self.ahits() if self.use_hits else None
+        if self.limit:
+            total = min(total, self.limit) if total is not None else self.limit
+        self.total = total
+
+        def windows():
+            start_index = page * self.page_size
+            while total is None or start_index < total:
+                count = (
+                    self.page_size
+                    if total is None
+                    else min(self.page_size, total - start_index)
+                )
+                yield start_index, count
+                start_index += count
+
+        fetches = self.ordered_fetches(
+            lambda window: self.afetch_features(*window), windows()
+        )
+        try:
+            async for (start_index, count), features in fetches:
+                yield start_index // self.page_size, features, None
+                if len(features) < count:
+                    return
+        finally:
+            await fetches.aclose()
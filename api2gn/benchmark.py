@@ -0,0 +1,376 @@
+"""
+Benchmark of the parsers against a local mock source: a HTTP server (in its
+own process) serving synthetic GeoNature exports, JSON pages and WFS
+GetFeature responses. The same seed and sizes always give the same data so
+the results of two runs can be compared.
+"""
+import json
+import multiprocessing
+import random
+import resource
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import click
+from sqlalchemy import event
+
+from geonature.utils.env import db
+
+from api2gn import writers
+from api2gn.geonature_parser import GeoNatureParser
+from api2gn.parsers import JSONParser, WFSParser
+
+
+SCENARIOS = ("json", "geonature", "wfs")
+
+NOMENCLATURE_CODES = {
+    "type_info_geo": "1",
+    "type_regroupement": "OBS",
+    "comportement": "1",
+    "technique_obs": "0",
+    "statut_biologique": "1",
+    "etat_biologique": "2",
+    "naturalite": "1",
+    "preuve_existante": "2",
+    "objet_denombrement": "IND",
+    "niveau_sensibilite": "0",
+    "statut_observation": "Pr",
+    "floutage_dee": "NON",
+    "statut_source": "Te",
+    "methode_determination": "1",
+}
+
+
+def synthetic_observation(seed, index):
+    """
+    Return the observation `index` of the synthetic dataset, in the format
+    of the GeoNature synthese export (with a GeoJSON geometry in addition)
+    """
+    rng = random.Random(seed * 1_000_003 + index)
+    x, y = round(rng.uniform(-5, 9), 6), round(rng.uniform(42, 51), 6)
+    date = f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+    count = rng.randint(1, 20)
+    return {
+        "id_synthese": index + 1,
+        "id_perm_sinp": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+        "id_perm_grp_sinp": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+        "date_debut": date,
+        "date_fin": date,
+        "cd_nom": rng.randint(1, 1_000_000),
+        "nom_cite": f"Taxon {rng.randint(1, 5000)}",
+        "nombre_min": count,
+        "nombre_max": count + rng.randint(0, 5),
+        "altitude_min": rng.randint(0, 2000),
+        "altitude_max": rng.randint(2000, 3000),
+        "profondeur_min": None,
+        "observateurs": f"Observateur {rng.randint(1, 200)}",
+        "determinateur": None,
+        "numero_preuve": None,
+        "preuve_numerique": None,
+        "preuve_non_numerique": None,
+        "comment_releve": "Relevé de test",
+        "comment_occurrence": None,
+        "date_creation": f"{date} 12:00:00",
+        "date_modification": f"{date} 12:00:00",
+        "code_habitat": None,
+        "nom_lieu": f"Lieu {rng.randint(1, 1000)}",
+        "precision": rng.randint(1, 100),
+        "methode_regroupement": None,
+        **NOMENCLATURE_CODES,
+        "wkt_4326": f"POINT({x} {y})",
+        "geometry": {"type": "Point", "coordinates": [x, y]},
+    }
+
+
+WFS_NAMESPACES = (
+    'xmlns:wfs="http://www.opengis.net/wfs/2.0" '
+    'xmlns:gml="http://www.opengis.net/gml/3.2" '
+    'xmlns:bench="http://api2gn/benchmark"'
+)
+
+
+def synthetic_feature(seed, index):
+    obs = synthetic_observation(seed, index)
+    x, y = obs["geometry"]["coordinates"]
+    # EPSG:4326 as URN: latitude first
+    return (
+        f'<wfs:member><bench:observation gml:id="observation.{index + 1}">'
+        f"<bench:unique_id>{obs['id_perm_sinp']}</bench:unique_id>"
+        f"<bench:taxon>{obs['cd_nom']}</bench:taxon>"
+        f"<bench:nom>{obs['nom_cite']}</bench:nom>"
+        f"<bench:date>{obs['date_debut']}</bench:date>"
+        f"<bench:effectif>{obs['nombre_min']}</bench:effectif>"
+        f"<bench:observateur>{obs['observateurs']}</bench:observateur>"
+        f'<bench:geom><gml:Point srsName="urn:ogc:def:crs:EPSG::4326">'
+        f"<gml:pos>{y} {x}</gml:pos></gml:Point></bench:geom>"
+        f"</bench:observation></wfs:member>"
+    )
+
+
+class MockSourceHandler(BaseHTTPRequestHandler):
+    """
+    Routes:
+        - /geonature: synthese export, keyset paging with
+          `filter_n_up_id_synthese` (greater or equal) and `limit`, items in
+          `items`, total in `total_filtered`. `offset` (page number) is also
+          supported
+        - /json: list of observations, `page` and `limit` parameters
+        - /wfs: WFS 2.0 GetFeature (`startIndex`, `count`, `resultType=hits`)
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def observations(self, start, count):
+        seed, nb_rows = self.server.seed, self.server.nb_rows
+        return [
+            synthetic_observation(seed, index)
+            for index in range(max(start, 0), min(start + count, nb_rows))
+        ]
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path == "/geonature":
+            limit = int(params.get("limit", 100))
+            # keyset paging: the id_synthese of an observation is its index + 1
+            first = max(int(params.get("filter_n_up_id_synthese", 1)) - 1, 0)
+            start = first + int(params.get("offset", 0)) * limit
+            body = {
+                "items": self.observations(start, limit),
+                "total_filtered": max(self.server.nb_rows - first, 0),
+            }
+            self.send_body(json.dumps(body).encode(), "application/json")
+        elif url.path == "/json":
+            limit = int(params.get("limit", 100))
+            body = self.observations(int(params.get("page", 0)) * limit, limit)
+            self.send_body(json.dumps(body).encode(), "application/json")
+        elif url.path == "/wfs":
+            self.send_body(self.get_feature(params).encode(), "text/xml")
+        else:
+            self.send_error(404)
+
+    def get_feature(self, params):
+        nb_rows = self.server.nb_rows
+        if params.get("resultType") == "hits":
+            return (
+                f'<wfs:FeatureCollection {WFS_NAMESPACES} numberMatched="{nb_rows}" '
+                f'numberReturned="0"/>'
+            )
+        start = int(params.get("startIndex", 0))
+        count = int(params.get("count") or params.get("maxFeatures") or nb_rows)
+        indexes = range(start, min(start + count, nb_rows))
+        members = "".join(
+            synthetic_feature(self.server.seed, index) for index in indexes
+        )
+        return (
+            f'<wfs:FeatureCollection {WFS_NAMESPACES} numberMatched="{nb_rows}" '
+            f'numberReturned="{len(indexes)}">{members}</wfs:FeatureCollection>'
+        )
+
+
+class MockSource:
+    """
+    Run the mock HTTP server in a child process (so it does not compete for
+    the GIL with the measured parser)
+    """
+
+    def __init__(self, nb_rows, seed=0):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), MockSourceHandler)
+        self.server.nb_rows = nb_rows
+        self.server.seed = seed
+        self.url = "http://127.0.0.1:{}".format(self.server.server_address[1])
+        self.process = multiprocessing.get_context("fork").Process(
+            target=self.server.serve_forever, daemon=True
+        )
+
+    def __enter__(self):
+        self.process.start()
+        # the socket is only used by the child process
+        self.server.socket.close()
+        return self
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.join()
+
+
+class SinkWriter(writers.BulkWriter):
+    """
+    Run the whole pipeline (including `prepare_chunk`) but discard the rows.
+    Used in a `rolled_back_transaction`
+    """
+
+    def write_chunk(self, chunk):
+        pass
+
+
+@contextmanager
+def rolled_back_transaction():
+    """
+    Roll back everything written in the block (parser, rejected rows, run
+    history...): the commits only release a savepoint, restarted after each
+    of them (same as the temporary transaction of the GeoNature tests)
+    """
+    outer_transaction = db.session.begin_nested()
+    inner_transaction = db.session.begin_nested()
+
+    def restart_savepoint(session, transaction):
+        nonlocal inner_transaction
+        if transaction is inner_transaction:
+            inner_transaction = session.begin_nested()
+
+    event.listen(db.session, "after_transaction_end", restart_savepoint)
+    try:
+        yield
+    finally:
+        event.remove(db.session, "after_transaction_end", restart_savepoint)
+        inner_transaction.rollback()
+        outer_transaction.rollback()
+
+
+class BenchmarkJSONParser(JSONParser):
+    name = "benchmark_json"
+    description = "Benchmark JSON source"
+    srid = 4326
+    mapping = {
+        "unique_id_sinp": "id_perm_sinp",
+        "date_min": "date_debut",
+        "date_max": "date_fin",
+        "cd_nom": "cd_nom",
+        "nom_cite": "nom_cite",
+        "count_min": "nombre_min",
+        "count_max": "nombre_max",
+        "observers": "observateurs",
+        "id_nomenclature_obs_technique": "technique_obs",
+        "id_nomenclature_bio_status": "statut_biologique",
+        "id_nomenclature_obj_count": "objet_denombrement",
+    }
+
+
+class BenchmarkGeoNatureParser(GeoNatureParser):
+    name = "benchmark_geonature"
+    description = "Benchmark GeoNature source"
+    progress_bar = False
+
+
+class BenchmarkWFSParser(WFSParser):
+    name = "benchmark_wfs"
+    description = "Benchmark WFS source"
+    srid = 4326
+    layer = "bench:observation"
+    wfs_version = "2.0.0"
+    limit = None
+    mapping = {
+        "unique_id_sinp": "unique_id",
+        "cd_nom": "taxon",
+        "nom_cite": "nom",
+        "date_min": "date",
+        "date_max": "date",
+        "count_min": "effectif",
+        "observers": "observateur",
+    }
+
+    def compile_mapping(self):
+        self.mapping = {**self.mapping, self.geometry_col: "geom"}
+        return super().compile_mapping()
+
+
+PARSER_CLASSES = {
+    "json": (BenchmarkJSONParser, "/json"),
+    "geonature": (BenchmarkGeoNatureParser, "/geonature"),
+    "wfs": (BenchmarkWFSParser, "/wfs"),
+}
+
+
+def benchmark_parser(scenario, url, settings):
+    """
+    Import the mock source with the parser of `scenario` and return
+    its timings, throughput and peak memory
+    """
+    parser_class, path = PARSER_CLASSES[scenario]
+    sink = settings["writer"] == "sink"
+    attributes = {
+        "url": url + path,
+        "writer_class": SinkWriter if sink else getattr(writers, settings["writer"]),
+        "chunk_size": settings["chunk_size"],
+        "constant_fields": {
+            **parser_class.constant_fields,
+            "id_source": settings["id_source"],
+            "id_dataset": settings["id_dataset"],
+        },
+        "checkpoint": False,
+    }
+    if scenario == "wfs":
+        attributes.update(page_size=settings["page_size"], stream=settings["stream"])
+    else:
+        attributes.update(
+            limit=settings["page_size"],
+            prefetch=settings["prefetch"],
+            stream_items=settings["stream"],
+        )
+    # with the sink nothing is kept in the database
+    with rolled_back_transaction() if sink else nullcontext():
+        parser = type(parser_class.__name__, (parser_class,), attributes)()
+        parser.run(history=False)
+    summary = parser.stats.summary(parser.nb_row_imported)
+    del summary["start_date"], summary["end_date"]
+    # kilobytes on Linux
+    summary["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return summary
+
+
+def run_benchmark(scenarios, settings):
+    """
+    Run each scenario in a new process against the same mock source, so
+    the peak memory of a scenario does not include the previous ones
+    """
+    results = {}
+    # the forked processes must open their own database connections
+    db.session.commit()
+    db.engine.dispose()
+    with MockSource(settings["rows"], settings["seed"]) as source:
+        for scenario in scenarios:
+            with ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context("fork")
+            ) as executor:
+                results[scenario] = executor.submit(
+                    benchmark_parser, scenario, source.url, settings
+                ).result()
+    return results
+
+
+def print_results(results, previous=None):
+    for scenario, result in results.items():
+        line = (
+            "{scenario}: {nb_row_imported} rows in {duration:.2f}s "
+            "({rows_per_second:.0f} rows/s), peak RSS {peak_rss_kb} kB - "
+            "http {http_duration:.2f}s, parse {parse_duration:.2f}s, "
+            "build {build_duration:.2f}s, write {write_duration:.2f}s".format(
+                scenario=scenario,
+                **{**result, "rows_per_second": result["rows_per_second"] or 0},
+            )
+        )
+        click.secho(line, fg="green")
+        before = (previous or {}).get(scenario)
+        if not before:
+            continue
+        for key in ("rows_per_second", "peak_rss_kb", "duration"):
+            if before.get(key) and result.get(key) is not None:
+                change = (result[key] - before[key]) / before[key] * 100
+                click.secho(
+                    f"  {key}: {before[key]:.1f} -> {result[key]:.1f} ({change:+.1f}%)",
+                    fg="yellow",
+                )
@@ -1,11 +1,31 @@
-from flask import Blueprint
+from flask import Blueprint, Response
+from werkzeug.exceptions import NotFound
 
-from api2gn.commands import cmd_list_parsers, run
+from geonature.utils.config import config
+
+from api2gn.commands import benchmark, cmd_list_parsers, replay, run
+from api2gn.metrics import prometheus_client
 
 blueprint = Blueprint("parser", __name__)
 
+
+@blueprint.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    Prometheus metrics of the parsers run by this process
+    """
+    if not prometheus_client or not config["API2GN"]["PROMETHEUS_METRICS_ENDPOINT"]:
+        raise NotFound()
+    return Response(
+        prometheus_client.generate_latest(),
+        mimetype=prometheus_client.CONTENT_TYPE_LATEST,
+    )
+
+
 blueprint.cli.add_command(cmd_list_parsers)
 blueprint.cli.add_command(run)
+blueprint.cli.add_command(benchmark)
+blueprint.cli.add_command(replay)
 
 from api2gn.admin import *
 from api2gn.tasks import setup_periodic_tasks
@@ -0,0 +1,94 @@
+"""
+Process level caches of the metadata read when a parser is instantiated.
+They do not change while the process runs, so the many short scheduled
+tasks of a Celery worker only pay for them once
+"""
+from functools import lru_cache
+
+from sqlalchemy import inspect
+from sqlalchemy.sql.schema import Column
+
+from geonature.core.gn_synthese.models import Synthese
+from geonature.utils.env import db
+from ref_geo.utils import get_local_srid
+
+from api2gn.models import ParserModel
+
+
+# key sets of the mappings already validated by `MappingValidator`
+validated_mappings = set()
+# ParserModel ids by parser name
+parser_ids = {}
+
+
+@lru_cache(maxsize=None)
+def local_srid():
+    return get_local_srid(db.session)
+
+
+@lru_cache(maxsize=None)
+def synthese_columns():
+    """
+    Return the names of all the Synthese columns and of the required ones
+    (NOT NULL and not primary key)
+    """
+    mapper = inspect(Synthese)
+    all_cols = frozenset(col.key for col in mapper.columns)
+    not_null_cols = frozenset(
+        col.key
+        for col in mapper.columns
+        if type(col) is Column and col.nullable is False and col.primary_key is False
+    )
+    return all_cols, not_null_cols
+
+
+@lru_cache(maxsize=None)
+def synthese_column_types():
+    """
+    Return by Synthese column its python type (None if unknown, ex: geometries),
+    the maximum length of its strings (or None) and if it is required
+    """
+    types = {}
+    for col in inspect(Synthese).columns:
+        if type(col) is not Column:
+            continue
+        try:
+            python_type = col.type.python_type
+        except NotImplementedError:
+            python_type = None
+        types[col.key] = (
+            python_type,
+            getattr(col.type, "length", None),
+            col.nullable is False and col.primary_key is False,
+        )
+    return types
+
+
+def get_or_create_parser(name, description):
+    """
+    Return the ParserModel of the parser `name`, created if needed.
+    Its id is kept so the next instantiations only look it up by primary
+    key (without query if it is already in the session)
+    """
+    parser = None
+    if name in parser_ids:
+        parser = db.session.get(ParserModel, parser_ids[name])
+    if parser is None:
+        parser = ParserModel.query.filter_by(name=name).one_or_none()
+    if parser is None:
+        parser = ParserModel(name=name, description=description)
+        db.session.add(parser)
+        db.session.commit()
+    parser_ids[name] = parser.id
+    return parser
+
+
+def clear():
+    """
+    Empty the caches (ex: after a change of the parsers or of the database)
+    """
+    validated_mappings.clear()
+    parser_ids.clear()
+    local_srid.cache_clear()
+    synthese_columns.cache_clear()
+    synthese_column_types.cache_clear()
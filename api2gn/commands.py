@@ -1,21 +1,123 @@
+import json
 import sys
 
 import click
 
 
-from api2gn.utils import list_parsers, get_parser
+from api2gn import registry
+from api2gn.models import ParserModel
+from api2gn.utils import get_parser
 
 
 @click.command(name="list")
 def cmd_list_parsers():
-    parsers = list_parsers()
-    for p in parsers:
-        click.secho(f"🌵 {p.name} - {p.description}", fg="green")
+    # the description of the parsers not imported is taken from the database
+    descriptions = {p.name: p.description for p in ParserModel.query.all()}
+    for name in registry.parser_names():
+        parser = registry.parsers.get(name)
+        description = parser.description if parser else descriptions.get(name)
+        click.secho(f"🌵 {name} - {description or ''}", fg="green")
 
 
 @click.command()
 @click.argument("name")
 @click.option("--dry-run", is_flag=True)
-def run(name, dry_run):
+@click.option(
+    "--shards",
+    type=int,
+    default=None,
+    help="Split the import in N page ranges imported by parallel processes",
+)
+@click.option(
+    "--restart",
+    is_flag=True,
+    help="Ignore the checkpoint of an unfinished import and start from the first page",
+)
+@click.option(
+    "--from-cache",
+    is_flag=True,
+    help="Use the cached responses (PARSER_CACHE_DIR) without requesting the source",
+)
+def run(name, dry_run, shards, restart, from_cache):
     Parser = get_parser(name)
-    Parser().run(dry_run)
+    parser = Parser()
+    parser.from_cache = from_cache
+    if shards:
+        parser.run_sharded(shards, dry_run, from_cache=from_cache)
+    else:
+        parser.run(dry_run, resume=not restart)
+
+
+@click.command()
+@click.argument("name")
+@click.option("--dry-run", is_flag=True)
+def replay(name, dry_run):
+    """
+    Import again the rows rejected by the previous imports (dead-letter table)
+    """
+    Parser = get_parser(name)
+    Parser().replay_rejected(dry_run)
+
+
+@click.command()
+@click.argument(
+    "scenarios", nargs=-1, type=click.Choice(["json", "geonature", "wfs"])
+)
+@click.option("--rows", type=int, default=10000, help="Size of the mock source")
+@click.option("--page-size", type=int, default=1000)
+@click.option("--chunk-size", type=int, default=None)
+@click.option("--prefetch", type=int, default=0, help="JSON sources only")
+@click.option(
+    "--stream",
+    is_flag=True,
+    help="Read the responses as a stream (WFS features, JSON items with ijson)",
+)
+@click.option(
+    "--writer",
+    type=click.Choice(
+        [
+            "sink",
+            "ORMWriter",
+            "BulkWriter",
+            "UpsertWriter",
+            "StagingWriter",
+            "StagingUpsertWriter",
+        ]
+    ),
+    default="sink",
+    help="`sink` discards the rows, the others write in the synthese "
+    "(use a throwaway database)",
+)
+@click.option("--id-source", type=int, default=1)
+@click.option("--id-dataset", type=int, default=1)
+@click.option("--seed", type=int, default=0)
+@click.option(
+    "--output", type=click.Path(dir_okay=False), help="Save the results (JSON)"
+)
+@click.option(
+    "--compare",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Results of a previous benchmark to compare with",
+)
+def benchmark(scenarios, output, compare, **settings):
+    """
+    Import a local mock source with the JSON, GeoNature and WFS parsers
+    """
+    # the parsers are only imported when needed
+    from api2gn.benchmark import SCENARIOS, print_results, run_benchmark
+
+    scenarios = scenarios or SCENARIOS
+    previous = None
+    if compare:
+        with open(compare) as f:
+            saved = json.load(f)
+        if saved["settings"] != settings:
+            click.secho(
+                "The compared benchmark was run with other settings", fg="yellow"
+            )
+        previous = saved["results"]
+    results = run_benchmark(scenarios, settings)
+    print_results(results, previous)
+    if output:
+        with open(output, "w") as f:
+            json.dump({"settings": settings, "results": results}, f, indent=2)
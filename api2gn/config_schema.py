@@ -3,5 +3,27 @@ from marshmallow import Schema, fields
 
 class Api2GNSchema(Schema):
     PARSER_NUMBER_OF_TRIES = fields.Integer(load_default=5)
+    # base delay of the exponential backoff between two tries
     PARSER_RETRY_SLEEP_TIME = fields.Integer(load_default=5)
+    PARSER_RETRY_MAX_SLEEP_TIME = fields.Integer(load_default=60)
     PARSER_RETRY_HTTP_STATUS = fields.List(fields.Integer(), load_default=[503])
+    PARSER_CHUNK_SIZE = fields.Integer(load_default=1000)
+    PARSER_HTTP_POOL_SIZE = fields.Integer(load_default=10)
+    PARSER_HTTP_CONNECT_TIMEOUT = fields.Float(load_default=10)
+    PARSER_HTTP_READ_TIMEOUT = fields.Float(load_default=60)
+    # rejected rows (see api2gn.dead_letter) above which an import stops
+    PARSER_MAX_REJECTED_ROWS = fields.Integer(load_default=1000, allow_none=True)
+    # on-disk response cache (disabled if not set), size in MB
+    PARSER_CACHE_DIR = fields.String(load_default=None, allow_none=True)
+    PARSER_CACHE_MAX_SIZE = fields.Integer(load_default=1024)
+    # requests in flight by async parser (see api2gn.async_parsers)
+    PARSER_ASYNC_CONCURRENCY = fields.Integer(load_default=4)
+    # scheduled runs
+    PARSER_MAX_CONCURRENT_RUNS = fields.Integer(load_default=4)
+    PARSER_MAX_CONCURRENT_RUNS_PER_HOST = fields.Integer(load_default=1)
+    PARSER_SCHEDULER_RETRY_DELAY = fields.Integer(load_default=60)
+    # hours after which an unfinished sharded run is considered lost
+    PARSER_SHARDED_RUN_TIMEOUT = fields.Integer(load_default=24)
+    # prometheus metrics (needs prometheus_client)
+    PROMETHEUS_METRICS_ENDPOINT = fields.Boolean(load_default=False)
+    PROMETHEUS_PUSHGATEWAY_URL = fields.String(load_default=None, allow_none=True)
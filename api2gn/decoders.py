@@ -0,0 +1,52 @@
+"""
+JSON decoders of the `JSONParser` (attribute `json_decoder`). The default
+decoder uses orjson when it is installed, the standard library otherwise.
+Streaming the items of the pages (`stream_items`) needs ijson.
+"""
+import json
+
+import click
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+class JSONDecoder:
+    """
+    Decoder of the standard library
+    """
+
+    def loads(self, content):
+        """
+        Decode a whole response body (bytes or str)
+        """
+        return json.loads(content)
+
+    def iter_items(self, response, prefix):
+        """
+        Yield the items found at the ijson `prefix` (ex: "items.item") of a
+        streamed response (UTF-8) while it is read: neither the body nor the
+        decoded page are kept in memory
+        """
+        if ijson is None:
+            raise click.ClickException(
+                "Streaming the items of the pages needs ijson (pip install ijson)"
+            )
+        response.raw.decode_content = True
+        yield from ijson.items(response.raw, prefix, use_float=True)
+
+
+class OrjsonDecoder(JSONDecoder):
+    def loads(self, content):
+        return orjson.loads(content)
+
+
+def default_decoder():
+    return OrjsonDecoder() if orjson is not None else JSONDecoder()
@@ -0,0 +1,116 @@
+"""
+Indexes of the keys already imported by a run (`Parser.dedup_key`), so the
+rows repeated by the source (offset paging on a changing source, overlapping
+date windows...) are only written once.
+
+    - `DedupIndex`: set of 64 bits digests of the keys
+    - `BloomDedupIndex`: Bloom filter of fixed size, the keys it may have
+      seen are confirmed with an exact lookup of the keys written by the run
+      (table `api2gn.dedup_key`)
+"""
+import hashlib
+import math
+
+
+def key_text(values):
+    return "\x1f".join(str(value) for value in values)
+
+
+def key_digest(values):
+    """
+    Return a 128 bits digest of the values of a key
+    """
+    return hashlib.blake2b(key_text(values).encode(), digest_size=16).digest()
+
+
+class DedupIndex:
+    """
+    Keep the first 64 bits of the digests: not strictly exact, two distinct
+    keys are taken for duplicates only on a 64 bits collision (probability
+    about n² / 2^65, 3e-6 for 10 million keys)
+    """
+
+    def __init__(self):
+        # ints are smaller than the bytes of the digests
+        self.digests = set()
+
+    def add(self, digest, key=None):
+        """
+        Add a key and return True if it was already seen
+        """
+        digest = int.from_bytes(digest[:8], "little")
+        if digest in self.digests:
+            return True
+        self.digests.add(digest)
+        return False
+
+    def preload(self, digest):
+        self.digests.add(int.from_bytes(digest[:8], "little"))
+
+    def pending_keys(self):
+        return []
+
+    def chunk_written(self):
+        pass
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.nb_bits = max(
+            math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2), 8
+        )
+        self.nb_hashes = max(round(self.nb_bits / capacity * math.log(2)), 1)
+        self.bits = bytearray((self.nb_bits + 7) // 8)
+
+    def positions(self, digest):
+        # double hashing on the two halves of the digest
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.nb_bits for i in range(self.nb_hashes)]
+
+    def add(self, digest):
+        """
+        Add a digest and return True if it may have been added before
+        """
+        seen = True
+        for position in self.positions(digest):
+            byte, bit = divmod(position, 8)
+            if not self.bits[byte] & (1 << bit):
+                seen = False
+                self.bits[byte] |= 1 << bit
+        return seen
+
+
+class BloomDedupIndex:
+    """
+    The memory does not depend on the number of keys. A key the filter may
+    have seen is a duplicate if it is one of the keys not written yet or if
+    `exists(key)` finds it among the written ones: a false positive of the
+    filter never drops a row
+    """
+
+    def __init__(self, capacity, error_rate, exists):
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.exists = exists
+        # keys added since the last written chunk, by digest
+        self.pending = {}
+
+    def add(self, digest, key):
+        if digest in self.pending:
+            return True
+        if self.bloom.add(digest) and self.exists(key):
+            return True
+        self.pending[digest] = key
+        return False
+
+    def preload(self, digest):
+        self.bloom.add(digest)
+
+    def pending_keys(self):
+        """
+        Keys to record with the chunk being written
+        """
+        return list(self.pending.values())
+
+    def chunk_written(self):
+        self.pending.clear()
@@ -0,0 +1,74 @@
+import click
+from geoalchemy2.elements import WKBElement
+
+try:
+    import numpy as np
+    import shapely
+    from pyproj import Transformer
+except ImportError:
+    shapely = None
+
+
+class GeometryPipeline:
+    """
+    Compute `the_geom_4326`, `the_geom_local` and `the_geom_point` in Python
+    for a batch of rows (shapely >= 2 vectorized functions + pyproj) instead
+    of letting PostGIS evaluate ST_Transform/ST_Centroid for each INSERT.
+    The source geometry is read from `geometry_col`, in `srid`.
+    """
+
+    def __init__(self, geometry_col, srid, local_srid):
+        if shapely is None or not hasattr(shapely, "from_wkb"):
+            raise click.ClickException(
+                "The client side geometry pipeline needs shapely>=2 and pyproj"
+            )
+        self.geometry_col = geometry_col
+        self.srid = srid
+        self.local_srid = local_srid
+        self.to_4326 = self._transformer(srid, 4326)
+        self.to_local = self._transformer(srid, local_srid)
+
+    @staticmethod
+    def _transformer(from_srid, to_srid):
+        if from_srid == to_srid:
+            return None
+        return Transformer.from_crs(from_srid, to_srid, always_xy=True)
+
+    @staticmethod
+    def _transform(geoms, transformer):
+        if transformer is None:
+            return geoms
+        return shapely.transform(
+            geoms,
+            lambda coords: np.column_stack(
+                transformer.transform(coords[:, 0], coords[:, 1])
+            ),
+        )
+
+    @staticmethod
+    def _to_elements(geoms, srid):
+        return [WKBElement(wkb, srid=srid) for wkb in shapely.to_wkb(geoms)]
+
+    def fill(self, rows):
+        """
+        Fill the geometry columns of the rows (dicts) in place
+        """
+        rows = [row for row in rows if row.get(self.geometry_col) is not None]
+        if not rows:
+            return
+        geoms = shapely.from_wkb(
+            [
+                bytes(wkb.data) if isinstance(wkb.data, memoryview) else wkb.data
+                for wkb in (row[self.geometry_col] for row in rows)
+            ]
+        )
+        geoms_4326 = self._transform(geoms, self.to_4326)
+        geoms_local = self._transform(geoms, self.to_local)
+        columns = {
+            "the_geom_4326": self._to_elements(geoms_4326, 4326),
+            "the_geom_local": self._to_elements(geoms_local, self.local_srid),
+            "the_geom_point": self._to_elements(shapely.centroid(geoms_4326), 4326),
+        }
+        for i, row in enumerate(rows):
+            for col, elements in columns.items():
+                row[col] = elements[i]
@@ -5,13 +5,23 @@ from shapely import wkt
 from geoalchemy2.shape import from_shape
 
 
+from api2gn.pagination import KeysetPagination
 from api2gn.parsers import JSONParser
 
 
 class GeoNatureParser(JSONParser):
     srid = 4326
     page_parameter = "offset"
+    # the export API pages on `offset` (page number): the deep pages are slow,
+    # use PageNumberPagination() to shard or prefetch
+    pagination = KeysetPagination(
+        "id_synthese", "filter_n_up_id_synthese", order_parameter="orderby"
+    )
     progress_bar = True
+    items_prefix = "items.item"
+    # the date of the last import changes at each run: --from-cache replays
+    # the responses of the last run
+    cache_ignored_params = ("filter_d_up_date_modification",)
 
     def __init__(self):
         self.api_filters = {**GeoNatureParser.api_filters, **self.api_filters}
@@ -27,7 +37,6 @@ class GeoNatureParser(JSONParser):
             self.api_filters[
                 "filter_d_up_date_modification"
             ] = self.parser_obj.last_import
-        self.validate_maping()
 
     @property
     def items(self):
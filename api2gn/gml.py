@@ -0,0 +1,192 @@
+"""
+Conversion of GML geometry elements (GML 2 and 3) to shapely geometries,
+directly from the parsed XML elements
+"""
+from functools import lru_cache
+
+from shapely.geometry import (
+    LineString,
+    MultiLineString,
+    MultiPoint,
+    MultiPolygon,
+    Point,
+    Polygon,
+)
+
+
+GEOMETRY_TYPES = {
+    "Point",
+    "LineString",
+    "Curve",
+    "Polygon",
+    "Surface",
+    "MultiPoint",
+    "MultiLineString",
+    "MultiCurve",
+    "MultiPolygon",
+    "MultiSurface",
+}
+
+try:
+    from pyproj import CRS
+    from pyproj.exceptions import CRSError
+except ImportError:
+    CRS = None
+
+# EPSG codes whose official axis order is northing/latitude first, used when
+# pyproj is not installed (pyproj gives the axis order of any EPSG code)
+YX_EPSG_CODES = {
+    # geographic: WGS 84, ETRS89, RGF93, NTF, NTF (Paris), ED50, NAD83, NAD27,
+    # RGFG95, RGR92
+    *(4326, 4258, 4171, 4275, 4807, 4230, 4269, 4267, 4624, 4627),
+    # ETRS89 / LCC Europe, LAEA Europe, TM26 to TM39
+    *(3034, 3035, *range(3038, 3052)),
+    # ETRF2000-PL / CS92, SWEREF99 TM
+    *(2180, 3006),
+}
+
+
+def local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+@lru_cache(maxsize=None)
+def is_yx_epsg(code):
+    """
+    Return True if the axis order of the EPSG `code` is northing/latitude
+    first
+    """
+    if CRS is not None:
+        try:
+            axis = CRS.from_epsg(code).axis_info
+        except CRSError:
+            return False
+        return bool(axis) and axis[0].direction.lower() in ("north", "south")
+    return code in YX_EPSG_CODES
+
+
+def _is_yx(srs_name):
+    """
+    The coordinates follow the official axis order only when the srsName is
+    an URN or an URI ("EPSG:4326" and
+    "http://www.opengis.net/gml/srs/epsg.xml#4326" are x/y)
+    """
+    if not srs_name or not (srs_name.startswith("urn:") or "/def/crs/" in srs_name):
+        return False
+    authority, _, code = srs_name.replace("/", ":").rpartition(":")
+    if "epsg" not in authority.lower() or not code.isdigit():
+        # ex: urn:ogc:def:crs:OGC:1.3:CRS84
+        return False
+    return is_yx_epsg(int(code))
+
+
+class GMLConverter:
+    def __init__(self, swap_axes=False, dimension=2):
+        self.swap_axes = swap_axes
+        self.dimension = dimension
+
+    def _coordinates(self, elem):
+        coords = []
+        for child in elem:
+            name = local_name(child.tag)
+            if name == "posList":
+                dimension = int(child.get("srsDimension") or self.dimension)
+                values = [float(v) for v in child.text.split()]
+                coords.extend(
+                    tuple(values[i : i + dimension])
+                    for i in range(0, len(values), dimension)
+                )
+            elif name == "pos":
+                coords.append(tuple(float(v) for v in child.text.split()))
+            elif name == "coordinates":
+                cs, ts = child.get("cs", ","), child.get("ts", " ")
+                decimal = child.get("decimal", ".")
+                for point in child.text.strip().split(ts):
+                    if point:
+                        coords.append(
+                            tuple(
+                                float(v.replace(decimal, ".")) for v in point.split(cs)
+                            )
+                        )
+            elif name == "coord":
+                coords.append(
+                    tuple(
+                        float(c.text)
+                        for c in child
+                        if local_name(c.tag) in ("X", "Y", "Z")
+                    )
+                )
+            elif name == "pointProperty":
+                coords.extend(self._coordinates(child[0]))
+        return coords
+
+    def coordinates(self, elem):
+        """
+        Coordinates of a Point, LineString, LinearRing or segment element
+        """
+        coords = self._coordinates(elem)
+        if self.swap_axes:
+            coords = [(c[1], c[0], *c[2:]) for c in coords]
+        return coords
+
+    def members(self, elem):
+        """
+        Geometries of a Multi* element (xxxMember and xxxMembers children)
+        """
+        for member in elem:
+            for geometry in member:
+                if local_name(geometry.tag) in GEOMETRY_TYPES:
+                    yield self.convert(geometry)
+
+    def polygon(self, elem):
+        exterior, interiors = None, []
+        for boundary in elem:
+            name = local_name(boundary.tag)
+            if name in ("exterior", "outerBoundaryIs"):
+                exterior = self.coordinates(boundary[0])
+            elif name in ("interior", "innerBoundaryIs"):
+                interiors.append(self.coordinates(boundary[0]))
+        return Polygon(exterior, interiors)
+
+    def convert(self, elem):
+        name = local_name(elem.tag)
+        if name == "Point":
+            return Point(self.coordinates(elem)[0])
+        if name == "LineString":
+            return LineString(self.coordinates(elem))
+        if name == "Curve":
+            coords = []
+            for segments in elem:
+                for segment in segments:
+                    segment_coords = self.coordinates(segment)
+                    # consecutive segments share their end/start point
+                    if coords and segment_coords and coords[-1] == segment_coords[0]:
+                        segment_coords = segment_coords[1:]
+                    coords.extend(segment_coords)
+            return LineString(coords)
+        if name == "Polygon":
+            return self.polygon(elem)
+        if name == "Surface":
+            polygons = [self.polygon(patch) for patches in elem for patch in patches]
+            return polygons[0] if len(polygons) == 1 else MultiPolygon(polygons)
+        if name == "MultiPoint":
+            return MultiPoint(list(self.members(elem)))
+        if name in ("MultiLineString", "MultiCurve"):
+            return MultiLineString(list(self.members(elem)))
+        if name in ("MultiPolygon", "MultiSurface"):
+            polygons = []
+            for geom in self.members(elem):
+                polygons.extend(getattr(geom, "geoms", [geom]))
+            return MultiPolygon(polygons)
+        raise ValueError(f"Unsupported GML geometry type {name}")
+
+
+def gml_to_shapely(elem):
+    """
+    Convert a GML geometry element (Point, LineString, Curve, Polygon,
+    Surface and their Multi* variants) to a shapely geometry
+    """
+    return GMLConverter(
+        swap_axes=_is_yx(elem.get("srsName")),
+        dimension=int(elem.get("srsDimension") or 2),
+    ).convert(elem)
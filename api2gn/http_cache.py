@@ -0,0 +1,187 @@
+"""
+On-disk cache of the source responses, to replay an import (ex: after
+fixing a mapping) without downloading the pages again.
+
+    <directory>/requests/<request key>.json: url, validators and headers of
+        the last response to the request (key: hash of the url and params)
+    <directory>/bodies/<content hash>.gz: gzip compressed bodies, shared by
+        the requests with the same response
+
+The total size of the bodies is limited, the least recently used ones are
+removed first. The size is counted as the bodies are stored: the directory is
+only scanned on the first store and when the limit is exceeded, then the
+bodies are removed down to `EVICT_RATIO` of the limit so the next scan is not
+at the next store.
+"""
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from datetime import datetime
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+# headers describing the encoded body, not the stored one
+ENCODING_HEADERS = ("content-encoding", "content-length", "transfer-encoding")
+
+# part of `max_size` kept by an eviction
+EVICT_RATIO = 0.9
+
+
+class ClosingGzipFile(gzip.GzipFile):
+    """
+    Closed once read to the end: a streamed body read from the cache does
+    not keep its file open until it is garbage collected
+    """
+
+    def read(self, size=-1):
+        if self.closed:
+            return b""
+        data = super().read(size)
+        if not data or size is None or size < 0:
+            self.close()
+        return data
+
+
+class ResponseCache:
+    def __init__(self, directory, max_size):
+        """
+        `max_size`: maximum size of the compressed bodies, in bytes
+        """
+        self.max_size = max_size
+        # total size of the bodies, None until the directory is scanned
+        self.size = None
+        self.requests_dir = os.path.join(directory, "requests")
+        self.bodies_dir = os.path.join(directory, "bodies")
+        os.makedirs(self.requests_dir, exist_ok=True)
+        os.makedirs(self.bodies_dir, exist_ok=True)
+
+    def request_key(self, url, params):
+        dump = json.dumps(
+            [url, sorted((params or {}).items())], default=str, sort_keys=True
+        )
+        return hashlib.sha256(dump.encode()).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.requests_dir, f"{key}.json")
+
+    def body_path(self, content_hash):
+        return os.path.join(self.bodies_dir, f"{content_hash}.gz")
+
+    def get(self, url, params):
+        """
+        Return the cache entry of the request or None
+        """
+        key = self.request_key(url, params)
+        try:
+            with open(self.entry_path(key)) as f:
+                entry = json.load(f)
+            # most recently used
+            os.utime(self.body_path(entry["body"]))
+        except (FileNotFoundError, ValueError):
+            return None
+        return entry
+
+    def validators(self, entry):
+        """
+        Headers of a conditional request revalidating `entry`
+        """
+        headers = {}
+        if entry["headers"].get("etag"):
+            headers["If-None-Match"] = entry["headers"]["etag"]
+        if entry["headers"].get("last-modified"):
+            headers["If-Modified-Since"] = entry["headers"]["last-modified"]
+        return headers
+
+    def response(self, entry, stream=False):
+        """
+        Return a `requests.Response` of the cached body. With `stream` the
+        body is read from the disk as it is consumed (not loaded in memory),
+        the file is closed at the end of the body or by `Response.close()`
+        """
+        response = requests.Response()
+        response.status_code = 200
+        response.url = entry["url"]
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        path = self.body_path(entry["body"])
+        if stream:
+            response.raw = ClosingGzipFile(path, "rb")
+        else:
+            with gzip.open(path, "rb") as body:
+                response._content = body.read()
+        return response
+
+    def store(self, url, params, response):
+        """
+        Save the body of `response` (read by chunks) and return the entry
+        """
+        content_hash = hashlib.blake2b(digest_size=16)
+        fd, tmp_path = tempfile.mkstemp(dir=self.bodies_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f, gzip.GzipFile(
+                fileobj=f, mode="wb", compresslevel=6
+            ) as body:
+                for chunk in response.iter_content(64 * 1024):
+                    content_hash.update(chunk)
+                    body.write(chunk)
+            content_hash = content_hash.hexdigest()
+            path = self.body_path(content_hash)
+            new_body = not os.path.exists(path)
+            size = os.path.getsize(tmp_path)
+            # identical bodies are stored once
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        entry = dict(
+            url=response.url or url,
+            body=content_hash,
+            date=datetime.now().isoformat(),
+            headers={
+                name.lower(): value
+                for name, value in response.headers.items()
+                if name.lower() not in ENCODING_HEADERS
+            },
+        )
+        key = self.request_key(url, params)
+        fd, tmp_path = tempfile.mkstemp(dir=self.requests_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self.entry_path(key))
+        if self.size is not None and new_body:
+            self.size += size
+        if self.size is None or self.size > self.max_size:
+            self.evict(keep=path)
+        return entry
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used bodies above `max_size`, down to
+        `EVICT_RATIO` of it (the entries of the removed bodies are misses),
+        except `keep`
+        """
+        bodies = []
+        with os.scandir(self.bodies_dir) as it:
+            for body in it:
+                if body.name.endswith(".gz"):
+                    stat = body.stat()
+                    bodies.append((stat.st_mtime, stat.st_size, body.path))
+        total = sum(size for _, size, _ in bodies)
+        if total <= self.max_size:
+            self.size = total
+            return
+        for _, size, path in sorted(bodies):
+            if total <= self.max_size * EVICT_RATIO:
+                break
+            if path == keep:
+                continue
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self.size = total
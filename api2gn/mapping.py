@@ -0,0 +1,78 @@
+import click
+
+
+class CompiledMapping:
+    """
+    The `constant_fields`, `dynamic_fields`, `mapping` and `additionnal_fields`
+    of a parser flattened once in a list of column extractors: each extractor
+    is a function taking the source row and returning the column value
+    """
+
+    def __init__(self, columns, additional_fields):
+        self.columns = columns
+        self.additional_fields = additional_fields
+
+    def apply(self, row):
+        synthese_dict = {gn_col: extract(row) for gn_col, extract in self.columns}
+        if self.additional_fields:
+            synthese_dict.setdefault("additional_data", {}).update(
+                {name: extract(row) for name, extract in self.additional_fields}
+            )
+        return synthese_dict
+
+
+def _constant(value):
+    return lambda row: value
+
+
+def _field(parser, gn_col, field):
+    """
+    Build the extractor of a `mapping` entry. The field is either the name of
+    the source field or a dict {"key": <source field>, "func": <function>},
+    the function taking the source value
+    """
+    if isinstance(field, dict):
+        getter, transform = parser.value_getter(field["key"]), field.get("func")
+    else:
+        getter, transform = parser.value_getter(field), None
+    if transform:
+        getter = (lambda get: lambda row: transform(get(row)))(getter)
+
+    if parser.resolve_nomenclature_codes and gn_col.startswith("id_nomenclature"):
+        try:
+            mnemonique_type = parser.nomenclature_mapping[gn_col]
+        except KeyError:
+            click.secho(
+                f"\nCannot find a nomenclature mnemonique type for `{gn_col}` - Please update the `nomenclature_mapping` class attribute",
+                fg="red",
+            )
+            raise click.ClickException("Stop import")
+        return lambda row: parser.nomenclatures.resolve(mnemonique_type, getter(row))
+    return getter
+
+
+def compile_mapping(parser, exclude=()):
+    """
+    Compile the mapping of a parser. As before, `dynamic_fields` take
+    precedence over `constant_fields`, both over `mapping`, and the mapping
+    columns named like an additional field are ignored.
+    Columns in `exclude` are not extracted from the row
+    """
+    extractors = {}
+    for gn_col, const in parser.constant_fields.items():
+        extractors[gn_col] = _constant(const)
+    for gn_col, _func in parser.dynamic_fields.items():
+        extractors[gn_col] = _func
+    for gn_col, field in parser.mapping.items():
+        if (
+            gn_col in extractors
+            or gn_col in parser.additionnal_fields
+            or gn_col in exclude
+        ):
+            continue
+        extractors[gn_col] = _field(parser, gn_col, field)
+    additional_fields = [
+        (name, parser.value_getter(field))
+        for name, field in parser.additionnal_fields.items()
+    ]
+    return CompiledMapping(list(extractors.items()), additional_fields)
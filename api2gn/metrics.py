@@ -0,0 +1,226 @@
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import click
+
+from geonature.utils.config import config
+
+try:
+    import prometheus_client
+except ImportError:
+    prometheus_client = None
+
+
+module_config = config["API2GN"]
+
+
+class RunStats:
+    """
+    Timings and counters of a parser run. Phase durations are cumulated
+    (the HTTP time of the prefetch threads can exceed the wall time):
+        - http: requests, including the download of non streamed bodies
+        - parse: decoding of the JSON/XML responses
+        - build: `build_object` and the batch geometry computation
+        - write: database writes and commits
+    """
+
+    PHASES = ("http", "parse", "build", "write")
+    COUNTERS = (
+        "nb_pages",
+        "nb_bytes",
+        "nb_retries",
+        "nb_row_skipped",
+        "nb_cache_hits",
+        "nb_row_rejected",
+        "nb_row_duplicated",
+    )
+
+    def __init__(self):
+        self.start_date = datetime.now()
+        self.durations = dict.fromkeys(self.PHASES, 0.0)
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        # updated by the prefetch threads
+        self._lock = threading.Lock()
+
+    def add_time(self, phase, duration):
+        with self._lock:
+            self.durations[phase] += duration
+
+    def incr(self, counter, value=1):
+        with self._lock:
+            self.counters[counter] += value
+
+    @contextmanager
+    def timer(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(phase, time.perf_counter() - start)
+
+    def timed_iter(self, iterable, phase):
+        """
+        Iterate over `iterable` counting the time spent to produce each item
+        """
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(phase, time.perf_counter() - start)
+                return
+            self.add_time(phase, time.perf_counter() - start)
+            yield item
+
+    def summary(self, nb_row_imported):
+        duration = (datetime.now() - self.start_date).total_seconds()
+        return dict(
+            start_date=self.start_date,
+            end_date=datetime.now(),
+            duration=duration,
+            nb_row_imported=nb_row_imported,
+            rows_per_second=nb_row_imported / duration if duration else None,
+            **{f"{phase}_duration": value for phase, value in self.durations.items()},
+            **self.counters,
+        )
+
+
+def response_size(response):
+    """
+    Number of bytes received for the body of a response
+    """
+    try:
+        return response.raw.tell()
+    except (AttributeError, OSError):
+        return len(response.content)
+
+
+def make_metrics(registry):
+    """
+    Create the metrics of the parsers in `registry`
+    """
+    return dict(
+        rows_fetched=prometheus_client.Counter(
+            "api2gn_rows_fetched",
+            "Rows fetched from the source",
+            ["parser"],
+            registry=registry,
+        ),
+        rows_inserted=prometheus_client.Counter(
+            "api2gn_rows_inserted",
+            "Rows handed to the writer",
+            ["parser"],
+            registry=registry,
+        ),
+        http_duration=prometheus_client.Histogram(
+            "api2gn_http_request_duration_seconds",
+            "HTTP requests latency",
+            ["parser"],
+            registry=registry,
+        ),
+        http_responses=prometheus_client.Counter(
+            "api2gn_http_responses",
+            "HTTP responses by status code",
+            ["parser", "status"],
+            registry=registry,
+        ),
+        http_retries=prometheus_client.Counter(
+            "api2gn_http_retries",
+            "HTTP requests retried",
+            ["parser"],
+            registry=registry,
+        ),
+        page_size=prometheus_client.Histogram(
+            "api2gn_page_size_rows",
+            "Rows by page",
+            ["parser"],
+            buckets=(10, 50, 100, 500, 1000, 5000, 10000, 50000),
+            registry=registry,
+        ),
+        db_flush_duration=prometheus_client.Histogram(
+            "api2gn_db_flush_duration_seconds",
+            "Duration of the writes and commit of a chunk",
+            ["parser"],
+            registry=registry,
+        ),
+    )
+
+
+# metrics of all the parsers run by the process (endpoint /metrics)
+PROCESS_METRICS = (
+    make_metrics(prometheus_client.REGISTRY) if prometheus_client else None
+)
+
+
+class ParserMetrics:
+    """
+    Prometheus metrics of a parser, labelled by parser name.
+    They are counted in the registry of the process (endpoint /metrics) and
+    in a registry of the run, the one pushed to the pushgateway: the group
+    of a parser only contains its own metrics.
+    Does nothing if `prometheus_client` is not installed
+    """
+
+    def __init__(self, parser_name):
+        self.parser_name = parser_name
+        self.enabled = prometheus_client is not None
+        self.grouping_key = {"parser": parser_name}
+        if self.enabled:
+            self.registry = prometheus_client.CollectorRegistry()
+            self.metrics = (PROCESS_METRICS, make_metrics(self.registry))
+
+    def labels(self, name, *labels):
+        return [
+            metrics[name].labels(self.parser_name, *labels) for metrics in self.metrics
+        ]
+
+    def observe_http(self, duration, status):
+        if self.enabled:
+            for metric in self.labels("http_duration"):
+                metric.observe(duration)
+            for metric in self.labels("http_responses", str(status)):
+                metric.inc()
+
+    def retry(self):
+        if self.enabled:
+            for metric in self.labels("http_retries"):
+                metric.inc()
+
+    def page_fetched(self, nb_rows):
+        if self.enabled:
+            for metric in self.labels("page_size"):
+                metric.observe(nb_rows)
+            for metric in self.labels("rows_fetched"):
+                metric.inc(nb_rows)
+
+    def row_inserted(self):
+        if self.enabled:
+            for metric in self.labels("rows_inserted"):
+                metric.inc()
+
+    def observe_flush(self, duration):
+        if self.enabled:
+            for metric in self.labels("db_flush_duration"):
+                metric.observe(duration)
+
+    def push(self):
+        """
+        Push the metrics of the run to the pushgateway
+        (PROMETHEUS_PUSHGATEWAY_URL), used for the runs made outside the web
+        process (Celery, commands)
+        """
+        url = module_config["PROMETHEUS_PUSHGATEWAY_URL"]
+        if not self.enabled or not url:
+            return
+        try:
+            prometheus_client.push_to_gateway(
+                url,
+                job="api2gn",
+                grouping_key=self.grouping_key,
+                registry=self.registry,
+            )
+        except OSError as e:
+            click.secho(f"Cannot push metrics to {url}: {e}", fg="yellow")
@@ -0,0 +1,51 @@
+"""parser run history
+
+Revision ID: 00b4251198ff
+Revises: 35f83897d8bf
+Create Date: 2026-10-18 17:48:10.631907
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "00b4251198ff"
+down_revision = "35f83897d8bf"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        """
+            CREATE TABLE api2gn.parser_run (
+                id SERIAL NOT NULL PRIMARY KEY,
+                id_parser integer NOT NULL REFERENCES api2gn.parser(id) ON DELETE CASCADE,
+                run_uuid uuid NOT NULL,
+                dry_run boolean NOT NULL DEFAULT false,
+                start_date timestamp NOT NULL,
+                end_date timestamp NOT NULL,
+                duration double precision,
+                http_duration double precision,
+                parse_duration double precision,
+                build_duration double precision,
+                write_duration double precision,
+                nb_pages integer,
+                nb_bytes bigint,
+                nb_retries integer,
+                nb_row_imported integer,
+                nb_row_skipped integer,
+                rows_per_second double precision
+            );
+            CREATE INDEX i_parser_run_id_parser ON api2gn.parser_run (id_parser);
+        """
+    )
+
+
+def downgrade():
+    op.execute(
+        """
+            DROP TABLE api2gn.parser_run;
+        """
+    )
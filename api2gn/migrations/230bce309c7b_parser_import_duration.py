@@ -0,0 +1,32 @@
+"""parser import duration
+
+Revision ID: 230bce309c7b
+Revises: 567aefb708ab
+Create Date: 2026-10-18 14:03:52.870142
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "230bce309c7b"
+down_revision = "567aefb708ab"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        """
+            ALTER TABLE api2gn.parser ADD COLUMN last_import_duration double precision;
+        """
+    )
+
+
+def downgrade():
+    op.execute(
+        """
+            ALTER TABLE api2gn.parser DROP COLUMN last_import_duration;
+        """
+    )
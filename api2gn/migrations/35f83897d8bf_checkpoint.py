@@ -0,0 +1,39 @@
+"""import checkpoint
+
+Revision ID: 35f83897d8bf
+Revises: 230bce309c7b
+Create Date: 2026-10-18 16:21:44.092315
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "35f83897d8bf"
+down_revision = "230bce309c7b"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        """
+            CREATE TABLE api2gn.checkpoint (
+                id_parser integer NOT NULL PRIMARY KEY REFERENCES api2gn.parser(id) ON DELETE CASCADE,
+                run_uuid uuid NOT NULL,
+                last_page integer NOT NULL,
+                nb_row_imported integer NOT NULL DEFAULT 0,
+                start_date timestamp NOT NULL,
+                update_date timestamp NOT NULL
+            );
+        """
+    )
+
+
+def downgrade():
+    op.execute(
+        """
+            DROP TABLE api2gn.checkpoint;
+        """
+    )
@@ -0,0 +1,38 @@
+"""synthese staging table
+
+Revision ID: 567aefb708ab
+Revises: 6c4a92069bdb
+Create Date: 2026-10-18 11:40:07.518263
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "567aefb708ab"
+down_revision = "6c4a92069bdb"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        """
+            CREATE UNLOGGED TABLE api2gn.synthese_staging (
+                id BIGSERIAL NOT NULL PRIMARY KEY,
+                id_parser integer NOT NULL,
+                data jsonb NOT NULL
+            );
+            CREATE INDEX i_synthese_staging_id_parser
+                ON api2gn.synthese_staging (id_parser);
+        """
+    )
+
+
+def downgrade():
+    op.execute(
+        """
+            DROP TABLE api2gn.synthese_staging;
+        """
+    )
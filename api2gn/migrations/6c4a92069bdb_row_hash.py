@@ -0,0 +1,37 @@
+"""row hash for upsert
+
+Revision ID: 6c4a92069bdb
+Revises: e27e2994d3bd
+Create Date: 2026-10-18 09:12:31.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "6c4a92069bdb"
+down_revision = "e27e2994d3bd"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        """
+            CREATE TABLE api2gn.row_hash (
+                id_parser integer NOT NULL REFERENCES api2gn.parser(id) ON DELETE CASCADE,
+                natural_key text NOT NULL,
+                content_hash text NOT NULL,
+                PRIMARY KEY (id_parser, natural_key)
+            );
+        """
+    )
+
+
+def downgrade():
+    op.execute(
+        """
+            DROP TABLE api2gn.row_hash;
+        """
+    )
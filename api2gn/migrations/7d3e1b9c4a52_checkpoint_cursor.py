@@ -0,0 +1,32 @@
+"""checkpoint cursor
+
+Revision ID: 7d3e1b9c4a52
+Revises: 00b4251198ff
+Create Date: 2026-10-18 18:02:13.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "7d3e1b9c4a52"
+down_revision = "00b4251198ff"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        """
+            ALTER TABLE api2gn.checkpoint ADD COLUMN cursor jsonb;
+        """
+    )
+
+
+def downgrade():
+    op.execute(
+        """
+            ALTER TABLE api2gn.checkpoint DROP COLUMN cursor;
+        """
+    )
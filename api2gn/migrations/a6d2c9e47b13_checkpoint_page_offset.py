@@ -0,0 +1,32 @@
+"""checkpoint page offset
+
+Revision ID: a6d2c9e47b13
+Revises: f3b8d6e2a471
+Create Date: 2026-10-18 21:14:37.402915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "a6d2c9e47b13"
+down_revision = "f3b8d6e2a471"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        """
+            ALTER TABLE api2gn.checkpoint ADD COLUMN page_offset integer NOT NULL DEFAULT 0;
+        """
+    )
+
+
+def downgrade():
+    op.execute(
+        """
+            ALTER TABLE api2gn.checkpoint DROP COLUMN page_offset;
+        """
+    )
@@ -0,0 +1,32 @@
+"""parser run cache hits
+
+Revision ID: b81f0c3e2d97
+Revises: 7d3e1b9c4a52
+Create Date: 2026-10-18 18:47:31.206733
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "b81f0c3e2d97"
+down_revision = "7d3e1b9c4a52"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        """
+            ALTER TABLE api2gn.parser_run ADD COLUMN nb_cache_hits integer;
+        """
+    )
+
+
+def downgrade():
+    op.execute(
+        """
+            ALTER TABLE api2gn.parser_run DROP COLUMN nb_cache_hits;
+        """
+    )
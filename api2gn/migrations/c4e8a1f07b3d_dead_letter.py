@@ -0,0 +1,44 @@
+"""dead letter
+
+Revision ID: c4e8a1f07b3d
+Revises: b81f0c3e2d97
+Create Date: 2026-10-18 19:12:54.318027
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "c4e8a1f07b3d"
+down_revision = "b81f0c3e2d97"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        """
+            CREATE TABLE api2gn.dead_letter (
+                id SERIAL NOT NULL PRIMARY KEY,
+                id_parser integer NOT NULL REFERENCES api2gn.parser(id) ON DELETE CASCADE,
+                run_uuid uuid NOT NULL,
+                stage varchar(20) NOT NULL,
+                error text NOT NULL,
+                payload jsonb,
+                synthese_values jsonb,
+                create_date timestamp NOT NULL DEFAULT now()
+            );
+            CREATE INDEX i_dead_letter_id_parser ON api2gn.dead_letter (id_parser);
+            ALTER TABLE api2gn.parser_run ADD COLUMN nb_row_rejected integer;
+        """
+    )
+
+
+def downgrade():
+    op.execute(
+        """
+            ALTER TABLE api2gn.parser_run DROP COLUMN nb_row_rejected;
+            DROP TABLE api2gn.dead_letter;
+        """
+    )
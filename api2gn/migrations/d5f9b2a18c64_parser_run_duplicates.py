@@ -0,0 +1,32 @@
+"""parser run duplicates
+
+Revision ID: d5f9b2a18c64
+Revises: c4e8a1f07b3d
+Create Date: 2026-10-18 19:41:07.562214
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "d5f9b2a18c64"
+down_revision = "c4e8a1f07b3d"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        """
+            ALTER TABLE api2gn.parser_run ADD COLUMN nb_row_duplicated integer;
+        """
+    )
+
+
+def downgrade():
+    op.execute(
+        """
+            ALTER TABLE api2gn.parser_run DROP COLUMN nb_row_duplicated;
+        """
+    )
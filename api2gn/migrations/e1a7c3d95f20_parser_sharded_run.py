@@ -0,0 +1,32 @@
+"""parser sharded run
+
+Revision ID: e1a7c3d95f20
+Revises: d5f9b2a18c64
+Create Date: 2026-10-18 20:26:43.905117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "e1a7c3d95f20"
+down_revision = "d5f9b2a18c64"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        """
+            ALTER TABLE api2gn.parser ADD COLUMN sharded_run_start timestamp;
+        """
+    )
+
+
+def downgrade():
+    op.execute(
+        """
+            ALTER TABLE api2gn.parser DROP COLUMN sharded_run_start;
+        """
+    )
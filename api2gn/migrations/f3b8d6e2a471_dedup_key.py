@@ -0,0 +1,37 @@
+"""dedup key
+
+Revision ID: f3b8d6e2a471
+Revises: e1a7c3d95f20
+Create Date: 2026-10-18 20:58:19.472630
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "f3b8d6e2a471"
+down_revision = "e1a7c3d95f20"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        """
+            CREATE UNLOGGED TABLE api2gn.dedup_key (
+                id_parser integer NOT NULL REFERENCES api2gn.parser(id) ON DELETE CASCADE,
+                run_uuid uuid NOT NULL,
+                key text NOT NULL,
+                PRIMARY KEY (id_parser, run_uuid, key)
+            );
+        """
+    )
+
+
+def downgrade():
+    op.execute(
+        """
+            DROP TABLE api2gn.dedup_key;
+        """
+    )
@@ -1,11 +1,12 @@
 from sqlalchemy.sql import func
 
-from geonature.utils.env import db
-from ref_geo.utils import get_local_srid
-
 from shapely.geometry import shape
 from geoalchemy2.shape import from_shape
 
+from api2gn import cache
+from api2gn.geometry import GeometryPipeline
+from api2gn.nomenclatures import NomenclatureResolver, DeferredNomenclatureResolver
+
 
 class NomenclatureMixin:
     nomenclature_mapping = {
@@ -24,9 +25,33 @@ class NomenclatureMixin:
         "id_nomenclature_source_status": "STATUT_SOURCE",
         "id_nomenclature_determination_method": "METH_DETERMIN",
     }
+    # translate the source codes of the `id_nomenclature_*` columns
+    resolve_nomenclature_codes = True
+    # policy for codes missing from ref_nomenclatures: "null", "error" or "reject"
+    nomenclature_fallback = "null"
+
+    def load_nomenclatures(self, columns):
+        """
+        Load in memory the nomenclatures of the types used by `columns`
+        """
+        if self.writer_class.resolve_in_db:
+            self.nomenclatures = DeferredNomenclatureResolver()
+            return
+        self.nomenclatures = NomenclatureResolver(
+            [
+                self.nomenclature_mapping[col]
+                for col in columns
+                if col in self.nomenclature_mapping
+            ],
+            fallback=self.nomenclature_fallback,
+        )
 
 
 class GeometryMixin:
+    # compute the derived geometries in Python (see api2gn.geometry)
+    client_side_geometry = False
+    geometry_pipeline = None
+
     def build_geom_local(self, geom_4326, srid):
         return func.st_transform(func.st_setsrid(geom_4326, 4326), srid)
 
@@ -44,18 +69,36 @@ class GeometryMixin:
     def geom_from_geojson(geojson):
         return func.st_geomfromgeojson()
 
+    def load_geometry_pipeline(self):
+        if self.client_side_geometry:
+            self.geometry_pipeline = GeometryPipeline(
+                self.geometry_col, self.srid, self.local_srid
+            )
+
     def fill_dict_with_geom(self, synthese_dict, wkb_geom):
         synthese_dict[self.geometry_col] = wkb_geom
+        if self.geometry_pipeline is not None or self.writer_class.resolve_in_db:
+            # the other columns are computed by batch in `prepare_chunk`
+            # or by the writer
+            return synthese_dict
         if self.geometry_col == "the_geom_local":
-            synthese_dict["the_geom_4326"] = self.build_geom_4326(wkb_geom, 2154)
+            synthese_dict["the_geom_4326"] = self.build_geom_4326(
+                wkb_geom, self.local_srid
+            )
             synthese_dict["the_geom_point"] = self.build_centroid_4326_from_local(
-                wkb_geom, 2154
+                wkb_geom, self.local_srid
             )
         elif self.geometry_col == "the_geom_4326":
-            synthese_dict["the_geom_local"] = self.build_geom_local(wkb_geom, 2154)
+            synthese_dict["the_geom_local"] = self.build_geom_local(
+                wkb_geom, self.local_srid
+            )
             synthese_dict["the_geom_point"] = self.build_centroid_from_4326(wkb_geom)
         return synthese_dict
 
+    def prepare_chunk(self, rows):
+        if self.geometry_pipeline is not None:
+            self.geometry_pipeline.fill(rows)
+
     @property
     def local_srid(self):
-        return get_local_srid(db.session)
+        return cache.local_srid()
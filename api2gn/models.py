@@ -1,3 +1,5 @@
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+
 from geonature.utils.env import DB
 
 
@@ -12,3 +14,97 @@ class ParserModel(DB.Model):
     nb_row_last_import = DB.Column(DB.Integer)
     nb_row_last_import = DB.Column(DB.Integer)
     schedule_frequency = DB.Column(DB.Integer)
+    # in seconds
+    last_import_duration = DB.Column(DB.Float)
+    # start of the sharded run whose shards are not all done (see api2gn.tasks)
+    sharded_run_start = DB.Column(DB.DateTime)
+
+
+class RowHashModel(DB.Model):
+    __tablename__ = "row_hash"
+    __table_args__ = {"schema": "api2gn"}
+    id_parser = DB.Column(DB.Integer, DB.ForeignKey(ParserModel.id), primary_key=True)
+    natural_key = DB.Column(DB.Unicode, primary_key=True)
+    content_hash = DB.Column(DB.Unicode, nullable=False)
+
+
+class CheckpointModel(DB.Model):
+    """
+    Position of the last row committed by an unfinished import
+    """
+
+    __tablename__ = "checkpoint"
+    __table_args__ = {"schema": "api2gn"}
+    id_parser = DB.Column(DB.Integer, DB.ForeignKey(ParserModel.id), primary_key=True)
+    run_uuid = DB.Column(UUID(as_uuid=True), nullable=False)
+    last_page = DB.Column(DB.Integer, nullable=False)
+    # rows of the page following `last_page` already processed
+    page_offset = DB.Column(DB.Integer, nullable=False, default=0)
+    # cursor of the next page (keyset and next link paginations)
+    cursor = DB.Column(JSONB)
+    nb_row_imported = DB.Column(DB.Integer, nullable=False, default=0)
+    start_date = DB.Column(DB.DateTime, nullable=False)
+    update_date = DB.Column(DB.DateTime, nullable=False)
+
+
+class ParserRunModel(DB.Model):
+    """
+    Timings and counters of each run of a parser
+    (durations in seconds, see `api2gn.metrics.RunStats`)
+    """
+
+    __tablename__ = "parser_run"
+    __table_args__ = {"schema": "api2gn"}
+    id = DB.Column(DB.Integer, primary_key=True)
+    id_parser = DB.Column(DB.Integer, DB.ForeignKey(ParserModel.id), nullable=False)
+    parser = DB.relationship(ParserModel)
+    run_uuid = DB.Column(UUID(as_uuid=True), nullable=False)
+    dry_run = DB.Column(DB.Boolean, nullable=False, default=False)
+    start_date = DB.Column(DB.DateTime, nullable=False)
+    end_date = DB.Column(DB.DateTime, nullable=False)
+    duration = DB.Column(DB.Float)
+    http_duration = DB.Column(DB.Float)
+    parse_duration = DB.Column(DB.Float)
+    build_duration = DB.Column(DB.Float)
+    write_duration = DB.Column(DB.Float)
+    nb_pages = DB.Column(DB.Integer)
+    nb_bytes = DB.Column(DB.BigInteger)
+    nb_retries = DB.Column(DB.Integer)
+    nb_row_imported = DB.Column(DB.Integer)
+    nb_row_skipped = DB.Column(DB.Integer)
+    nb_cache_hits = DB.Column(DB.Integer)
+    nb_row_rejected = DB.Column(DB.Integer)
+    nb_row_duplicated = DB.Column(DB.Integer)
+    rows_per_second = DB.Column(DB.Float)
+
+
+class DedupKeyModel(DB.Model):
+    """
+    Keys written by the running imports using a Bloom filter for the
+    deduplication (see `api2gn.dedup.BloomDedupIndex`)
+    """
+
+    __tablename__ = "dedup_key"
+    __table_args__ = {"schema": "api2gn"}
+    id_parser = DB.Column(DB.Integer, DB.ForeignKey(ParserModel.id), primary_key=True)
+    run_uuid = DB.Column(UUID(as_uuid=True), primary_key=True)
+    key = DB.Column(DB.UnicodeText, primary_key=True)
+
+
+class DeadLetterModel(DB.Model):
+    """
+    Row rejected by an import, with the error and the source payload
+    (stage: build, validation or write)
+    """
+
+    __tablename__ = "dead_letter"
+    __table_args__ = {"schema": "api2gn"}
+    id = DB.Column(DB.Integer, primary_key=True)
+    id_parser = DB.Column(DB.Integer, DB.ForeignKey(ParserModel.id), nullable=False)
+    parser = DB.relationship(ParserModel)
+    run_uuid = DB.Column(UUID(as_uuid=True), nullable=False)
+    stage = DB.Column(DB.Unicode(20), nullable=False)
+    error = DB.Column(DB.UnicodeText, nullable=False)
+    payload = DB.Column(JSONB)
+    synthese_values = DB.Column(JSONB)
+    create_date = DB.Column(DB.DateTime, nullable=False, server_default=DB.func.now())
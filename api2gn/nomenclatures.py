@@ -0,0 +1,88 @@
+from collections import Counter
+
+import click
+import sqlalchemy as sa
+
+from geonature.utils.env import db
+
+from api2gn.schema import ValidationError
+
+
+class NomenclatureResolver:
+    """
+    Resolve (type mnemonique, cd_nomenclature) to `id_nomenclature` from
+    an in-memory copy of `ref_nomenclatures` loaded once for the given types.
+
+    Unknown codes are resolved following the `fallback` policy:
+        - "null": the column is set to NULL
+        - "error": the import is stopped
+        - "reject": the row is rejected (see `Parser.reject`)
+    """
+
+    FALLBACKS = ("null", "error", "reject")
+
+    def __init__(self, types, fallback="null"):
+        if fallback not in self.FALLBACKS:
+            raise ValueError(
+                f"Unknown nomenclature fallback `{fallback}`, use one of {self.FALLBACKS}"
+            )
+        self.fallback = fallback
+        self.hits = 0
+        self.misses = Counter()
+        self.cache = {}
+        types = set(types)
+        if not types:
+            return
+        query = sa.text(
+            """
+            SELECT t.mnemonique, n.cd_nomenclature, n.id_nomenclature
+            FROM ref_nomenclatures.t_nomenclatures n
+            JOIN ref_nomenclatures.bib_nomenclatures_types t ON t.id_type = n.id_type
+            WHERE t.mnemonique IN :types
+            """
+        ).bindparams(sa.bindparam("types", expanding=True))
+        for mnemonique, cd_nomenclature, id_nomenclature in db.session.execute(
+            query, {"types": list(types)}
+        ):
+            self.cache[(mnemonique, cd_nomenclature)] = id_nomenclature
+
+    def resolve(self, mnemonique_type, code):
+        if code is None:
+            return None
+        try:
+            id_nomenclature = self.cache[(mnemonique_type, str(code))]
+        except KeyError:
+            self.misses[(mnemonique_type, code)] += 1
+            if self.fallback == "error":
+                raise click.ClickException(
+                    f"Unknown nomenclature code `{code}` for type `{mnemonique_type}`"
+                )
+            if self.fallback == "reject":
+                raise ValidationError(
+                    f"Unknown nomenclature code `{code}` for type `{mnemonique_type}`"
+                )
+            return None
+        self.hits += 1
+        return id_nomenclature
+
+    def report(self):
+        nb_misses = sum(self.misses.values())
+        click.secho(
+            f"Nomenclatures: {self.hits} resolved, {nb_misses} unknown",
+            fg="yellow" if nb_misses else "green",
+        )
+        for (mnemonique_type, code), count in self.misses.most_common(10):
+            click.secho(f"  - {mnemonique_type} `{code}`: {count} row(s)", fg="yellow")
+
+
+class DeferredNomenclatureResolver:
+    """
+    Keep the nomenclature codes as they are: they are resolved later in the
+    database by the writer (see `StagingWriter`)
+    """
+
+    def resolve(self, mnemonique_type, code):
+        return code
+
+    def report(self):
+        pass
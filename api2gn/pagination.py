@@ -0,0 +1,151 @@
+"""
+Pagination strategies of the `JSONParser` (attribute `pagination`).
+
+A strategy gives the request of a page from its number and from the cursor
+computed on the previous page. The page number and offset strategies can
+request any page (prefetch, shards). The keyset and next link strategies
+follow the pages in order: each page is requested from the previous one,
+so the source does not scan the rows of the previous pages (deep OFFSET)
+"""
+from urllib.parse import urljoin
+
+
+class Pagination:
+    # pages can be requested in any order (prefetch, shards)
+    random_access = False
+    # the next cursor only depends on the items (pages can be streamed)
+    streamable = True
+
+    def request(self, parser, page, cursor):
+        """
+        Return the url and the query parameters of `page`. `cursor` is the
+        value returned by `next_cursor` for the previous page (None for
+        the first page)
+        """
+        raise NotImplementedError
+
+    def next_cursor(self, parser, root, items):
+        """
+        Return the cursor of the page following the decoded page `root`
+        (None if there is no next page)
+        """
+        return None
+
+    def filter_items(self, items, cursor):
+        """
+        Return the items of the page to import
+        """
+        return items
+
+    def is_last_page(self, parser, nb_items, cursor, next_cursor):
+        """
+        Return True if the page of `nb_items` items, requested with `cursor`,
+        is the last one: a page not full for the numbered pages. The pages
+        followed by cursor end on an empty page, without next cursor or when
+        the cursor does not move (ex: a keyset page only holding the last
+        row of the previous one). A short page does not mean the end (ex:
+        the source caps the limit asked)
+        """
+        if self.random_access:
+            return nb_items < parser.limit
+        return not nb_items or next_cursor is None or next_cursor == cursor
+
+    def base_params(self, parser):
+        return {**parser.api_filters, parser.limit_parameter: parser.limit}
+
+
+class PageNumberPagination(Pagination):
+    """
+    The page number is sent in `parameter` (the `page_parameter` of the
+    parser by default)
+    """
+
+    random_access = True
+
+    def __init__(self, parameter=None):
+        self.parameter = parameter
+
+    def page_value(self, parser, page):
+        return page
+
+    def request(self, parser, page, cursor):
+        parameter = self.parameter or parser.page_parameter
+        return parser.url, {
+            **self.base_params(parser),
+            parameter: self.page_value(parser, page),
+        }
+
+
+class OffsetPagination(PageNumberPagination):
+    """
+    The number of rows to skip (page * limit) is sent in `parameter`
+    """
+
+    def __init__(self, parameter="offset"):
+        super().__init__(parameter)
+
+    def page_value(self, parser, page):
+        return page * parser.limit
+
+
+class KeysetPagination(Pagination):
+    """
+    The rows are ordered on `key` (sent in `order_parameter`) and each page
+    asks the rows whose key is greater than the last key of the previous page
+    (sent in `parameter`). The items already seen are dropped, for the sources
+    whose filter is "greater or equal". The key must be unique
+    """
+
+    def __init__(self, key, parameter, order_parameter=None):
+        self.key = key
+        self.parameter = parameter
+        self.order_parameter = order_parameter
+
+    def request(self, parser, page, cursor):
+        params = self.base_params(parser)
+        if self.order_parameter:
+            params[self.order_parameter] = self.key
+        if cursor is not None:
+            params[self.parameter] = cursor
+        return parser.url, params
+
+    def next_cursor(self, parser, root, items):
+        return items[-1][self.key] if items else None
+
+    def filter_items(self, items, cursor):
+        if cursor is None:
+            return items
+        return [item for item in items if item[self.key] > cursor]
+
+
+class NextLinkPagination(Pagination):
+    """
+    The decoded page gives the next page at the (dotted) path `next_key`:
+    an url (absolute or relative to the parser url), or a cursor sent in
+    `cursor_parameter`
+    """
+
+    streamable = False
+
+    def __init__(self, next_key="next", cursor_parameter=None):
+        self.next_key = next_key
+        self.cursor_parameter = cursor_parameter
+
+    def request(self, parser, page, cursor):
+        if cursor is None:
+            return parser.url, self.base_params(parser)
+        if self.cursor_parameter:
+            return parser.url, {
+                **self.base_params(parser),
+                self.cursor_parameter: cursor,
+            }
+        # the link contains the query parameters
+        return urljoin(parser.url, cursor), None
+
+    def next_cursor(self, parser, root, items):
+        value = root
+        for key in self.next_key.split("."):
+            if not isinstance(value, dict):
+                return None
+            value = value.get(key)
+        return value or None
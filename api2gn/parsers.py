@@ -1,14 +1,26 @@
+import codecs
+import itertools
+import math
+import operator
+import multiprocessing
+import random
 import requests
+import time
+import uuid
 import xml.etree.ElementTree as ET
-import pygml
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from time import sleep
 
 
 from datetime import datetime
 import click
 
+import sqlalchemy as sa
 from tqdm import tqdm
-from sqlalchemy.sql import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
 from shapely.geometry import shape
 from geoalchemy2.shape import from_shape
 
@@ -16,9 +28,23 @@ from geonature.core.gn_synthese.models import Synthese
 from geonature.utils.env import db
 from geonature.utils.config import config
 
-from api2gn.schema import MappingValidator
+from api2gn import cache, decoders, registry
+from api2gn.dedup import BloomDedupIndex, DedupIndex, key_digest, key_text
+from api2gn.gml import GEOMETRY_TYPES, gml_to_shapely, local_name
+from api2gn.http_cache import ResponseCache
+from api2gn.mapping import compile_mapping
+from api2gn.pagination import PageNumberPagination
+from api2gn.schema import MappingValidator, RowValidator, ValidationError
 from api2gn.mixins import GeometryMixin, NomenclatureMixin
-from api2gn.models import ParserModel
+from api2gn.metrics import ParserMetrics, RunStats, response_size
+from api2gn.models import (
+    CheckpointModel,
+    DeadLetterModel,
+    DedupKeyModel,
+    ParserModel,
+    ParserRunModel,
+)
+from api2gn.writers import ORMWriter, json_value
 
 
 module_config = config["API2GN"]
@@ -43,8 +69,54 @@ class Parser(GeometryMixin, NomenclatureMixin):
     api_filters = dict()
     srid = None
     progress_bar = False
+    total = None
     page_parameter = "page"
     limit_parameter = "limit"
+    writer_class = ORMWriter
+    chunk_size: int = None
+    # commit every `chunk_size` rows instead of once at the end (ORMWriter)
+    chunked_commit = True
+    # natural key used by the UpsertWriter
+    upsert_key = ("unique_id_sinp",)
+    # save the last page committed to resume an import which failed
+    checkpoint = True
+    # range of pages to import (end excluded), see `JSONParser.run_shard`
+    start_page = 0
+    end_page: int = None
+    # cursor of `start_page` (see `JSONParser.start_cursor`)
+    resume_cursor = None
+    checkpoint_cursor = None
+    # rows of `start_page` already imported by the resumed run
+    resume_page_offset = 0
+    # use the cached responses without request (see `request_or_retry`)
+    from_cache = False
+    # use the response cache (PARSER_CACHE_DIR) if it is configured
+    use_cache = True
+    # query parameters left out of the cache key (ex: incremental filter
+    # changing at each run), the cached responses are still revalidated
+    cache_ignored_params = ()
+    # stop the import above this number of rejected rows
+    # (PARSER_MAX_REJECTED_ROWS if not set)
+    max_rejected_rows: int = None
+    # Synthese columns identifying an observation: the rows whose key was
+    # already imported by the run are dropped (None: no deduplication)
+    dedup_key = ("unique_id_sinp",)
+    # also drop the rows already in the synthese for the `id_source` of the parser
+    dedup_preload = False
+    # Bloom filter sized for this number of keys instead of an exact index
+    dedup_bloom_capacity: int = None
+    dedup_bloom_error_rate = 0.001
+    dedup_index = None
+    # source row of the object being inserted (see `insert`)
+    current_row = None
+    _http_session = None
+    _response_cache = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # the base classes (JSONParser, GeoNatureParser...) have no name
+        if "name" in cls.__dict__:
+            registry.register(cls)
 
     def __init__(
         self,
@@ -52,8 +124,14 @@ class Parser(GeometryMixin, NomenclatureMixin):
         self.geometry_col = (
             "the_geom_local" if self.local_srid == self.srid else "the_geom_4326"
         )
-        self.parser_obj = self._get_or_create_parser()
+        self.parser_id = self._get_or_create_parser().id
+        self.stats = RunStats()
+        self.metrics = ParserMetrics(self.name)
         self.validate_maping()
+        self.compiled_mapping = self.compile_mapping()
+        self.row_validator = self.make_row_validator()
+        # rejected rows not written yet in the dead-letter table
+        self.rejected = []
 
     def validate_maping(self):
         """
@@ -63,43 +141,186 @@ class Parser(GeometryMixin, NomenclatureMixin):
             {**self.mapping, **self.constant_fields, **self.dynamic_fields}
         ).validate()
 
+    def compile_mapping(self):
+        return compile_mapping(self)
+
+    def make_row_validator(self):
+        # the writers resolving the nomenclatures in the database get the
+        # codes of the source ("Pr", "OBS"...) instead of ids
+        if self.writer_class.resolve_in_db:
+            return RowValidator(untyped_cols=self.nomenclature_mapping)
+        return RowValidator()
+
+    def value_getter(self, field):
+        """
+        Return a function extracting the value of `field` from a source row
+        """
+        raise NotImplementedError
+
     @property
     def items(self):
         return self.root
 
+    def get_total(self):
+        """
+        Return the total number of items announced by the source
+        for the current page, or None
+        """
+        try:
+            return self.total
+        except (KeyError, TypeError):
+            return None
+
     def _get_or_create_parser(self):
-        parser = ParserModel.query.filter_by(name=self.name).one_or_none()
-        if not parser:
-            parser = ParserModel(
-                name=self.name,
-                description=self.description,
-            )
-            db.session.add(parser)
-            db.session.commit()
+        return cache.get_or_create_parser(self.name, self.description)
+
+    @property
+    def parser_obj(self):
+        parser = db.session.get(ParserModel, self.parser_id)
+        if parser is None:
+            # deleted since the parser was instantiated
+            parser = self._get_or_create_parser()
+            self.parser_id = parser.id
         return parser
 
+    @property
+    def http_session(self):
+        """
+        HTTP session shared by all the requests of the parser: connections
+        are kept alive and pooled (also between the prefetch threads)
+        """
+        if self._http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=module_config["PARSER_HTTP_POOL_SIZE"],
+                pool_maxsize=max(
+                    module_config["PARSER_HTTP_POOL_SIZE"], getattr(self, "prefetch", 0)
+                ),
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+            self._http_session = session
+        return self._http_session
+
+    def retry_delay(self, attempt):
+        """
+        Exponential backoff with full jitter
+        """
+        return random.uniform(
+            0,
+            min(
+                module_config["PARSER_RETRY_MAX_SLEEP_TIME"],
+                module_config["PARSER_RETRY_SLEEP_TIME"] * 2 ** (attempt - 1),
+            ),
+        )
+
+    @property
+    def response_cache(self):
+        """
+        The on-disk response cache (PARSER_CACHE_DIR) or None
+        """
+        if (
+            self._response_cache is None
+            and self.use_cache
+            and module_config["PARSER_CACHE_DIR"]
+        ):
+            self._response_cache = ResponseCache(
+                module_config["PARSER_CACHE_DIR"],
+                module_config["PARSER_CACHE_MAX_SIZE"] * 1024 * 1024,
+            )
+        return self._response_cache
+
+    def cached_response(self, entry, stream=False):
+        self.stats.incr("nb_pages")
+        self.stats.incr("nb_cache_hits")
+        return self.response_cache.response(entry, stream)
+
     def request_or_retry(self, url, **kwargs):
-        try_get = module_config["PARSER_NUMBER_OF_TRIES"]
-        assert try_get > 0
-        while try_get:
-            response = requests.get(url, allow_redirects=True, **kwargs)
-            if response.status_code in module_config["PARSER_RETRY_HTTP_STATUS"]:
-                click.info("Failed to fetch url {}. Retrying ...".format(url))
-                sleep(module_config["PARSER_RETRY_SLEEP_TIME"])
-                try_get -= 1
-            elif response.status_code == 200:
+        """
+        GET `url`, retrying on connection errors and PARSER_RETRY_HTTP_STATUS.
+        With the response cache, the cached responses are revalidated
+        (ETag/Last-Modified) or, with `from_cache`, used without request
+        """
+        nb_tries = module_config["PARSER_NUMBER_OF_TRIES"]
+        assert nb_tries > 0
+        kwargs.setdefault(
+            "timeout",
+            (
+                module_config["PARSER_HTTP_CONNECT_TIMEOUT"],
+                module_config["PARSER_HTTP_READ_TIMEOUT"],
+            ),
+        )
+        cache, entry = self.response_cache, None
+        if self.from_cache and cache is None:
+            raise click.ClickException("PARSER_CACHE_DIR is not set, no cache to use")
+        cache_params = {
+            key: value
+            for key, value in (kwargs.get("params") or {}).items()
+            if key not in self.cache_ignored_params
+        }
+        if cache is not None:
+            entry = cache.get(url, cache_params)
+            if self.from_cache:
+                if entry is None:
+                    # ex: the filters of the request changed since it was cached
+                    raise click.ClickException(
+                        f"No cached response for {url} with {cache_params}"
+                    )
+                return self.cached_response(entry, kwargs.get("stream"))
+            if entry is not None:
+                kwargs["headers"] = {
+                    **kwargs.get("headers", {}),
+                    **cache.validators(entry),
+                }
+        response = None
+        for attempt in range(nb_tries):
+            if attempt:
+                self.stats.incr("nb_retries")
+                self.metrics.retry()
+                sleep(self.retry_delay(attempt))
+            start = time.perf_counter()
+            try:
+                response = self.http_session.get(url, allow_redirects=True, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.metrics.observe_http(time.perf_counter() - start, "error")
+                click.secho(f"Failed to fetch url {url} ({e}). Retrying ...", fg="yellow")
+                continue
+            finally:
+                self.stats.add_time("http", time.perf_counter() - start)
+            self.metrics.observe_http(
+                time.perf_counter() - start, response.status_code
+            )
+            if response.status_code == 304 and entry is not None:
+                return self.cached_response(entry, kwargs.get("stream"))
+            if response.status_code == 200:
+                if cache is not None:
+                    with self.stats.timer("http"):
+                        entry = cache.store(url, cache_params, response)
+                    self.stats.incr("nb_pages")
+                    if not kwargs.get("stream"):
+                        self.stats.incr("nb_bytes", response_size(response))
+                    # read back from the disk (streamed responses stay streamed)
+                    return cache.response(entry, kwargs.get("stream"))
+                self.stats.incr("nb_pages")
+                if not kwargs.get("stream"):
+                    # streamed bodies are counted once read
+                    self.stats.incr("nb_bytes", response_size(response))
                 return response
-            else:
+            if response.status_code not in module_config["PARSER_RETRY_HTTP_STATUS"]:
                 break
+            click.secho("Failed to fetch url {}. Retrying ...".format(url), fg="yellow")
+        status_code = response.status_code if response is not None else None
         click.secho(
             "Failed to fetch {} after {} times. Status code : {}.".format(
-                url, module_config["PARSER_NUMBER_OF_TRIES"], response.status_code
+                url, attempt + 1, status_code
             ),
             fg="red",
         )
         raise click.ClickException(
             ("Failed to download {url}. HTTP status code {status_code}").format(
-                url=response.url, status_code=response.status_code
+                url=response.url if response is not None else url,
+                status_code=status_code,
             )
         )
 
@@ -109,8 +330,263 @@ class Parser(GeometryMixin, NomenclatureMixin):
     def build_object(self):
         raise NotImplemented
 
+    def to_object(self, synthese_dict):
+        """
+        Return the built row in the form expected by the writer:
+        a plain column dict for bulk writers, a `Synthese` instance otherwise.
+        Raise a `ValidationError` if the row does not fit the Synthese columns
+        """
+        error = self.row_validator.validate(synthese_dict)
+        if error:
+            raise ValidationError(error)
+        if self.writer_class.as_dict:
+            return synthese_dict
+        # `prepare_chunk` is called by the writer on each chunk
+        return Synthese(**synthese_dict)
+
     def insert(self, obj):
-        db.session.add(obj)
+        # the source row is kept by the writer to reject it if it is refused
+        self.writer.write(obj, self.current_row)
+        self.metrics.row_inserted()
+
+    def serialize_row(self, row):
+        """
+        Return the source row as stored in the dead-letter table
+        """
+        return row
+
+    def reject(self, row, error, stage, values=None):
+        """
+        Keep a row rejected at `stage` (build, validation or write) for the
+        dead-letter table, it is written with the next chunk
+        """
+        self.stats.incr("nb_row_rejected")
+        if stage == "write":
+            # counted when handed to the writer
+            self.nb_row_imported -= 1
+        if not isinstance(error, str):
+            error = f"{type(error).__name__}: {error}"
+        try:
+            payload = json_value(self.serialize_row(row))
+        except Exception as e:
+            payload = {"serialization_error": str(e)}
+        self.rejected.append(
+            dict(
+                id_parser=self.parser_id,
+                run_uuid=self.run_uuid,
+                stage=stage,
+                error=error,
+                payload=payload,
+                synthese_values=json_value(values) if values is not None else None,
+            )
+        )
+        max_rejected_rows = (
+            self.max_rejected_rows
+            if self.max_rejected_rows is not None
+            else module_config["PARSER_MAX_REJECTED_ROWS"]
+        )
+        if (
+            max_rejected_rows is not None
+            and self.stats.counters["nb_row_rejected"] > max_rejected_rows
+        ):
+            raise click.ClickException(
+                f"More than {max_rejected_rows} rejected row(s), stop import (last error: {error})"
+            )
+
+    def load_dedup_index(self):
+        """
+        Create the index of the keys imported by the run, if the mapping
+        fills the columns of `dedup_key`
+        """
+        self.dedup_index = None
+        mapped_cols = {**self.mapping, **self.constant_fields, **self.dynamic_fields}
+        if not self.dedup_key or any(col not in mapped_cols for col in self.dedup_key):
+            return
+        if self.dedup_preload and self.writer_class.upsert:
+            raise click.ClickException(
+                f"`dedup_preload` would drop the updated rows of {self.name}, "
+                "it cannot be used with an upsert writer"
+            )
+        column_types = cache.synthese_column_types()
+        self.dedup_uuid_cols = {
+            col for col in self.dedup_key if column_types[col][0] is uuid.UUID
+        }
+        if self.dedup_bloom_capacity:
+            self.dedup_index = BloomDedupIndex(
+                self.dedup_bloom_capacity, self.dedup_bloom_error_rate, self.key_exists
+            )
+        else:
+            self.dedup_index = DedupIndex()
+        if self.dedup_preload:
+            self.preload_dedup_index()
+
+    def normalize_key(self, values):
+        """
+        Return the key of `dedup_key` values (None if incomplete)
+        """
+        key = []
+        for col, value in zip(self.dedup_key, values):
+            if value is None:
+                return None
+            if col in self.dedup_uuid_cols and not isinstance(value, uuid.UUID):
+                try:
+                    value = uuid.UUID(str(value))
+                except ValueError:
+                    return None
+            key.append(value)
+        return tuple(key)
+
+    def preload_dedup_index(self):
+        """
+        Add to the index the keys of the synthese rows of the `id_source`
+        of the parser (constant field)
+        """
+        id_source = self.constant_fields.get("id_source")
+        if id_source is None:
+            raise click.ClickException(
+                f"`dedup_preload` needs a constant `id_source` in the parser {self.name}"
+            )
+        table = Synthese.__table__
+        result = db.session.execute(
+            sa.select(*[table.c[col] for col in self.dedup_key])
+            .where(table.c.id_source == id_source)
+            .execution_options(stream_results=True)
+        )
+        nb_keys = 0
+        for rows in result.partitions(10000):
+            for values in rows:
+                key = self.normalize_key(values)
+                if key is not None:
+                    self.dedup_index.preload(key_digest(key))
+            nb_keys += len(rows)
+        click.secho(f"{nb_keys} key(s) of source {id_source} preloaded", fg="green")
+
+    def key_exists(self, key):
+        """
+        Confirm a key seen by the Bloom filter: return True if it was written
+        by the run or, with `dedup_preload`, if the synthese has it for the
+        `id_source` of the parser
+        """
+        written = (
+            db.session.execute(
+                sa.select(sa.literal(1)).where(
+                    DedupKeyModel.id_parser == self.parser_id,
+                    DedupKeyModel.run_uuid == self.run_uuid,
+                    DedupKeyModel.key == key_text(key),
+                )
+            ).first()
+            is not None
+        )
+        if written or not self.dedup_preload:
+            return written
+        table = Synthese.__table__
+        query = sa.select(sa.literal(1)).where(
+            table.c.id_source == self.constant_fields["id_source"],
+            *[table.c[col] == value for col, value in zip(self.dedup_key, key)],
+        )
+        return db.session.execute(query.limit(1)).first() is not None
+
+    def save_dedup_keys(self):
+        """
+        Record (in the current transaction) the keys of the chunk being written
+        """
+        if self.dedup_index is None:
+            return
+        keys = self.dedup_index.pending_keys()
+        if keys:
+            stmt = pg_insert(DedupKeyModel.__table__).values(
+                [
+                    dict(
+                        id_parser=self.parser_id,
+                        run_uuid=self.run_uuid,
+                        key=key_text(key),
+                    )
+                    for key in keys
+                ]
+            )
+            db.session.execute(stmt.on_conflict_do_nothing())
+
+    def clear_dedup_keys(self):
+        """
+        Delete the keys recorded by the run, once it is done
+        """
+        if not isinstance(self.dedup_index, BloomDedupIndex):
+            return
+        db.session.execute(
+            sa.delete(DedupKeyModel.__table__).where(
+                DedupKeyModel.id_parser == self.parser_id,
+                DedupKeyModel.run_uuid == self.run_uuid,
+            )
+        )
+        db.session.commit()
+
+    def is_duplicate(self, obj):
+        """
+        Return True if the key of the built row was already imported
+        """
+        if self.dedup_index is None:
+            return False
+        if isinstance(obj, dict):
+            values = [obj.get(col) for col in self.dedup_key]
+        else:
+            values = [getattr(obj, col, None) for col in self.dedup_key]
+        key = self.normalize_key(values)
+        if key is None:
+            return False
+        return self.dedup_index.add(key_digest(key), key)
+
+    def chunk_committed(self):
+        """
+        Called by the writer once a chunk is committed
+        """
+        if self.dedup_index is not None:
+            self.dedup_index.chunk_written()
+
+    def deserialize_row(self, payload):
+        """
+        Return the source row stored in the dead-letter table
+        """
+        return payload
+
+    def replay_rejected(self, dry_run=False):
+        """
+        Import again the rows of the dead-letter table (ex: after a fix of the
+        mapping or of the nomenclatures). The replayed rows are removed from
+        the table, the ones rejected again are added back by the run
+        """
+        letters = db.session.execute(
+            sa.select(DeadLetterModel.id, DeadLetterModel.payload)
+            .where(
+                DeadLetterModel.id_parser == self.parser_id,
+                DeadLetterModel.payload.isnot(None),
+            )
+            .order_by(DeadLetterModel.id)
+        ).all()
+        if not letters:
+            click.secho(f"No rejected row to replay for {self.name}", fg="green")
+            return
+        click.secho(f"Replay {len(letters)} rejected row(s)", fg="green")
+        self.next_row = lambda page=0: (
+            self.deserialize_row(payload) for _, payload in letters
+        )
+        self.run(dry_run=dry_run, history=False)
+        if not dry_run:
+            db.session.execute(
+                sa.delete(DeadLetterModel.__table__).where(
+                    DeadLetterModel.id_parser == self.parser_id,
+                    DeadLetterModel.payload.isnot(None),
+                    DeadLetterModel.id <= letters[-1].id,
+                )
+            )
+            db.session.commit()
+
+    def save_rejected(self):
+        """
+        Write (in the current transaction) the rows rejected since the last chunk
+        """
+        if self.rejected:
+            db.session.execute(sa.insert(DeadLetterModel.__table__), self.rejected)
+            self.rejected = []
 
     def start(self):
         pass
@@ -118,33 +594,177 @@ class Parser(GeometryMixin, NomenclatureMixin):
     def end(self):
         pass
 
+    def load_checkpoint(self, resume=True):
+        """
+        Resume from the checkpoint left by an unfinished import
+        (or drop it if `resume` is False)
+        """
+        self.run_uuid = uuid.uuid4()
+        self.resume_page_offset = 0
+        if not self.checkpoint_enabled:
+            return
+        checkpoint = db.session.get(CheckpointModel, self.parser_id)
+        if checkpoint is None:
+            return
+        if not resume:
+            db.session.delete(checkpoint)
+            db.session.commit()
+            return
+        click.secho(
+            f"Resume import from page {checkpoint.last_page + 1}, row "
+            f"{checkpoint.page_offset} ({checkpoint.nb_row_imported} row(s) "
+            "already imported)",
+            fg="yellow",
+        )
+        self.run_uuid = checkpoint.run_uuid
+        self.start_page = checkpoint.last_page + 1
+        self.resume_page_offset = checkpoint.page_offset
+        self.resume_cursor = checkpoint.cursor
+        self.nb_row_imported = checkpoint.nb_row_imported
+        self.start_date = checkpoint.start_date
+
+    def save_checkpoint(self):
+        """
+        Record (in the current transaction) the position of the last row
+        processed: the pages up to `last_page_done` and the first
+        `page_offset` rows of the next one. Called when a chunk is committed,
+        all the rows read until then are written (or rejected, skipped...)
+        """
+        if not self.checkpoint_enabled:
+            return
+        values = dict(
+            id_parser=self.parser_id,
+            run_uuid=self.run_uuid,
+            last_page=self.last_page_done,
+            page_offset=self.page_offset,
+            cursor=self.checkpoint_cursor,
+            nb_row_imported=self.nb_row_imported,
+            start_date=self.start_date,
+            update_date=datetime.now(),
+        )
+        stmt = pg_insert(CheckpointModel.__table__).values(values)
+        db.session.execute(
+            stmt.on_conflict_do_update(index_elements=["id_parser"], set_=values)
+        )
+
+    def clear_checkpoint(self):
+        if self.checkpoint_enabled:
+            db.session.execute(
+                sa.delete(CheckpointModel.__table__).where(
+                    CheckpointModel.id_parser == self.parser_id
+                )
+            )
+
+    def page_done(self, page, nb_rows, cursor=None):
+        """
+        Called by `next_row` once the `nb_rows` rows of `page` are yielded.
+        `cursor` is the cursor of the next page, saved with the checkpoint
+        """
+        self.checkpoint_cursor = cursor
+        self.last_page_done = page
+        self.page_offset = 0
+        self.metrics.page_fetched(nb_rows)
+        self.writer.page_done(page)
+
     def save_history(self):
         self.parser_obj.last_import = datetime.now()
+        self.parser_obj.last_import_duration = (
+            self.parser_obj.last_import - self.start_date
+        ).total_seconds()
         self.parser_obj.nb_row_last_import = self.nb_row_imported
         self.parser_obj.nb_row_total = self.nb_row_imported + (
             self.parser_obj.nb_row_total or 0
         )
         db.session.commit()
 
-    def run(self, dry_run=False):
+    def save_run(self, dry_run=False):
+        """
+        Save the timings and counters of the run in `api2gn.parser_run`
+        """
+        summary = self.stats.summary(self.nb_row_imported)
+        db.session.add(
+            ParserRunModel(
+                id_parser=self.parser_id,
+                run_uuid=self.run_uuid,
+                dry_run=dry_run,
+                **summary,
+            )
+        )
+        db.session.commit()
+        click.secho(
+            "Run in {duration:.1f}s ({rows_per_second:.1f} rows/s) - http {http_duration:.1f}s, "
+            "parse {parse_duration:.1f}s, build {build_duration:.1f}s, write {write_duration:.1f}s - "
+            "{nb_pages} page(s) ({nb_cache_hits} from cache), {nb_bytes} bytes, {nb_retries} retries, {nb_row_skipped} row(s) skipped, "
+            "{nb_row_rejected} row(s) rejected, {nb_row_duplicated} duplicate(s)".format(
+                **{**summary, "rows_per_second": summary["rows_per_second"] or 0}
+            ),
+            fg="green",
+        )
+
+    def run(self, dry_run=False, history=True, resume=True):
+        """
+        Import the source. In dry run the whole pipeline runs but each chunk
+        is rolled back, and the history of the parser is not changed
+        """
         click.secho(f"Start import {self.name} ...", fg="green")
-        self.start()
+        self.start_date = datetime.now()
         self.nb_row_imported = 0
-        previous_percetage = 0
+        self.stats = RunStats()
+        self.rejected = []
+        self.checkpoint_enabled = self.checkpoint and history and not dry_run
+        self.load_checkpoint(resume)
+        # position of the last row read (see `save_checkpoint`)
+        self.last_page_done = self.start_page - 1
+        self.page_offset = self.resume_page_offset
+        self.start()
+        self.writer = self.writer_class(
+            self,
+            dry_run=dry_run,
+            chunk_size=self.chunk_size or module_config["PARSER_CHUNK_SIZE"],
+        )
+        self.load_nomenclatures(self.mapping)
+        self.load_geometry_pipeline()
+        self.load_dedup_index()
         click.secho("Fetching data from source", fg="green")
         if self.progress_bar:
-            pbar = tqdm(total=100)
-        for row in self.next_row():
-            obj = self.build_object(row)
+            # the total is known once the first page is fetched
+            pbar = tqdm(initial=self.nb_row_imported, unit=" rows")
+        # keep compatibility with the parsers overriding `next_row()` without page
+        rows = self.next_row(self.start_page) if self.start_page else self.next_row()
+        if self.resume_page_offset:
+            # already imported by the resumed run
+            rows = itertools.islice(rows, self.resume_page_offset, None)
+        for row in rows:
+            self.page_offset += 1
+            # the pending objects are only flushed by the writer
+            with self.stats.timer("build"), db.session.no_autoflush:
+                try:
+                    obj = self.build_object(row)
+                except click.ClickException:
+                    raise
+                except ValidationError as e:
+                    self.reject(row, str(e), "validation")
+                    continue
+                except Exception as e:
+                    # ex: a field missing from the row
+                    self.reject(row, e, "build")
+                    continue
             if not obj:
+                self.stats.incr("nb_row_skipped")
                 continue
-            self.insert(obj)
+            with self.stats.timer("build"), db.session.no_autoflush:
+                duplicate = self.is_duplicate(obj)
+            if duplicate:
+                self.stats.incr("nb_row_duplicated")
+                continue
+            self.current_row = row
+            # counted before the insert, which may commit the chunk
             self.nb_row_imported += 1
+            self.insert(obj)
             if self.progress_bar:
-                previous_percetage = (self.nb_row_imported / self.total) * 100
-                new_percentage = (self.nb_row_imported / self.total) * 100
-                to_update = new_percentage - previous_percetage
-                pbar.update(to_update)
+                if pbar.total is None and self.get_total():
+                    pbar.total = self.get_total()
+                pbar.update(1)
         if self.progress_bar:
             pbar.close()
 
@@ -152,15 +772,41 @@ class Parser(GeometryMixin, NomenclatureMixin):
             "Successfully fetch data from source. Inserting data in db now...",
             fg="green",
         )
-        if not dry_run:
-            db.session.commit()
-        self.save_history()
+        self.writer.close()
+        self.writer.report()
+        self.clear_dedup_keys()
+        if history and not dry_run:
+            self.clear_checkpoint()
+            self.save_history()
+        self.save_run(dry_run)
+        self.metrics.push()
         self.end()
+        self.nomenclatures.report()
         click.secho(f"Successfully import {self.nb_row_imported} row(s)", fg="green")
 
 
+def _run_shard(parser_class, start_page, end_page, dry_run, from_cache):
+    parser = parser_class()
+    parser.from_cache = from_cache
+    return parser.run_shard(start_page, end_page, dry_run=dry_run)
+
+
 class JSONParser(Parser):
     limit = 100
+    # see api2gn.pagination (default: page number in `page_parameter`)
+    pagination = None
+    # see api2gn.decoders (default: orjson if installed)
+    json_decoder = None
+    # read the items of each page one by one from the response (needs ijson)
+    stream_items = False
+    # ijson prefix of the items in a page, as returned by `items`
+    items_prefix = "item"
+    # number of pages fetched ahead in background threads (0: no prefetch)
+    prefetch = 0
+    # number of Celery subtasks sharing the scheduled imports (None: no shard)
+    nb_shards: int = None
+    # shards of a scheduled run importing at the same time (None: all)
+    shard_concurrency: int = None
 
     def get_geom(self, row):
         """
@@ -169,60 +815,255 @@ class JSONParser(Parser):
         shapely_geom = shape(row["geometry"])
         return from_shape(shapely_geom, srid=self.srid)
 
-    def build_object(self, row):
-        synthese_dict = {}
-        for gn_col, const in self.constant_fields.items():
-            synthese_dict[gn_col] = const
-            self.mapping.pop(gn_col, None)
-        for gn_col, _func in self.dynamic_fields.items():
-            synthese_dict[gn_col] = _func(row)
-            self.mapping.pop(gn_col, None)
-        if self.additionnal_fields:
-            for add_field, json_field in self.additionnal_fields.items():
-                self.mapping.pop(add_field, None)
-                synthese_dict.setdefault("additional_data", {})[add_field] = row[
-                    json_field
-                ]
+    def value_getter(self, json_field):
+        return operator.itemgetter(json_field)
 
-        for gn_col, json_field in self.mapping.items():
-            if gn_col.startswith("id_nomenclature"):
-                try:
-                    nomenclature_mnemonique_type = self.nomenclature_mapping[gn_col]
-                except KeyError as e:
-                    click.secho(
-                        f"\nCannot find a nomenclature mnemonique type for `{gn_col}` - Please update the `nomenclature_mapping` class attribute",
-                        fg="red",
-                    )
-                    raise click.ClickException("Stop import")
-                synthese_dict[gn_col] = func.ref_nomenclatures.get_id_nomenclature(
-                    nomenclature_mnemonique_type, row[json_field]
-                )
-            else:
-                synthese_dict[gn_col] = row[json_field]
+    def build_object(self, row):
+        synthese_dict = self.compiled_mapping.apply(row)
         wkb_geom = self.get_geom(row)
         if wkb_geom:
             synthese_dict = self.fill_dict_with_geom(synthese_dict, wkb_geom)
-        return Synthese(**synthese_dict)
+        return self.to_object(synthese_dict)
+
+    @property
+    def paginator(self):
+        return self.pagination or PageNumberPagination(self.page_parameter)
+
+    @property
+    def decoder(self):
+        if self.json_decoder is None:
+            self.json_decoder = decoders.default_decoder()
+        return self.json_decoder
+
+    def decode_json(self, response):
+        content = response.content
+        # orjson only reads UTF-8 bytes
+        if response.encoding and codecs.lookup(response.encoding).name != "utf-8":
+            content = content.decode(response.encoding)
+        with self.stats.timer("parse"):
+            return self.decoder.loads(content)
+
+    def fetch_page(self, page, cursor=None):
+        url, params = self.paginator.request(self, page, cursor)
+        return self.decode_json(self.request_or_retry(url, params=params))
+
+    def stream_page(self, page, cursor=None):
+        """
+        Request `page` and yield its items while the response is read
+        """
+        url, params = self.paginator.request(self, page, cursor)
+        response = self.request_or_retry(url, params=params, stream=True)
+        # the page is not decoded as a whole
+        self.root = None
+        yield from self.stats.timed_iter(
+            self.decoder.iter_items(response, self.items_prefix), "parse"
+        )
+        self.stats.incr("nb_bytes", response_size(response))
+
+    def get_last_page(self):
+        """
+        Return the last page to fetch from the total announced by the source
+        and `end_page`, or None if unknown: when the source gives the total,
+        no request is made past the last page
+        """
+        total = self.get_total()
+        last_page = math.ceil(total / self.limit) - 1 if total is not None else None
+        if self.end_page is not None:
+            last_page = min(
+                last_page if last_page is not None else self.end_page,
+                self.end_page - 1,
+            )
+        return last_page
+
+    def start_cursor(self, page):
+        """
+        Return the cursor to request `page`: with the keyset and next link
+        paginations, the cursor saved by the checkpoint of the resumed import
+        """
+        if not page or self.paginator.random_access:
+            return None
+        if self.resume_cursor is None:
+            raise click.ClickException(
+                f"No cursor to resume {self.name} at page {page}, use --restart"
+            )
+        return self.resume_cursor
+
+    def pages(self, page=0):
+        """
+        Yield the page numbers, the items of the pages and the cursors of
+        the next pages from `page` until the last one
+        (`Pagination.is_last_page`)
+        """
+        cursor = self.start_cursor(page)
+        while self.end_page is None or page < self.end_page:
+            self.root = self.fetch_page(page, cursor)
+            items = self.items
+            next_cursor = self.paginator.next_cursor(self, self.root, items)
+            yield page, self.paginator.filter_items(items, cursor), next_cursor
+            if self.paginator.is_last_page(self, len(items), cursor, next_cursor):
+                break
+            page += 1
+            cursor = next_cursor
+
+    def prefetch_pages(self, page=0):
+        """
+        Same as `pages` but the next `prefetch` pages are fetched in
+        background threads while the current one is processed.
+        Pages are still yielded in order and at most `prefetch` pages
+        are kept waiting in memory.
+        """
+        if self.end_page is not None and page >= self.end_page:
+            return
+        self.root = self.fetch_page(page)
+        last_page = self.get_last_page()
+        items = self.items
+        yield page, items, None
+        if len(items) < self.limit:
+            return
+        next_page = page + 1
+        futures = deque()
+        with ThreadPoolExecutor(max_workers=self.prefetch) as executor:
+            try:
+                while True:
+                    while len(futures) < self.prefetch and (
+                        last_page is None or next_page <= last_page
+                    ):
+                        futures.append(
+                            (next_page, executor.submit(self.fetch_page, next_page))
+                        )
+                        next_page += 1
+                    if not futures:
+                        break
+                    current_page, future = futures.popleft()
+                    self.root = future.result()
+                    items = self.items
+                    yield current_page, items, None
+                    if len(items) < self.limit:
+                        break
+            finally:
+                for _, future in futures:
+                    future.cancel()
+
+    def next_streamed_row(self, page=0):
+        """
+        Same as `next_row` but the items are yielded while each page is read
+        (`stream_items`): a page is never entirely in memory. The total
+        announced by the source is not read
+        """
+        if not self.paginator.streamable:
+            raise click.ClickException(
+                f"The pagination of {self.name} needs the whole pages, they cannot be streamed"
+            )
+        cursor = self.start_cursor(page)
+        while self.end_page is None or page < self.end_page:
+            nb_items, last_item = 0, None
+            for item in self.stream_page(page, cursor):
+                nb_items += 1
+                last_item = item
+                yield from self.paginator.filter_items([item], cursor)
+            next_cursor = self.paginator.next_cursor(
+                self, None, [last_item] if nb_items else []
+            )
+            self.page_done(page, nb_items, next_cursor)
+            if self.paginator.is_last_page(self, nb_items, cursor, next_cursor):
+                break
+            page += 1
+            cursor = next_cursor
 
     def next_row(self, page=0):
-        filters = {
-            **self.api_filters,
-            self.page_parameter: page,
-            self.limit_parameter: self.limit,
-        }
-        while True:
-            response = self.request_or_retry(self.url, params=filters)
-            self.root = response.json()
-            for row in self.items:
+        if self.stream_items:
+            yield from self.next_streamed_row(page)
+            return
+        if self.prefetch and self.paginator.random_access:
+            pages = self.prefetch_pages(page)
+        else:
+            pages = self.pages(page)
+        for current_page, items, cursor in pages:
+            for row in items:
                 yield row
-            if len(self.items) < self.limit:
-                break
-            filters[self.page_parameter] += 1
+            self.page_done(current_page, len(items), cursor)
+
+    def shards(self, nb_shards):
+        """
+        Split the pages to import in `nb_shards` ranges (start_page, end_page),
+        from the total announced by the source. The last range is left open
+        to catch the items added during the import
+        """
+        if not self.paginator.random_access:
+            raise click.ClickException(
+                f"The pagination of {self.name} follows the pages in order, it cannot "
+                "be sharded (use `pagination = PageNumberPagination()`)"
+            )
+        self.root = self.fetch_page(0)
+        total = self.get_total()
+        if total is None:
+            raise click.ClickException(
+                f"The source of {self.name} does not give the total number of items, it cannot be sharded"
+            )
+        nb_pages = max(math.ceil(total / self.limit), 1)
+        size = math.ceil(nb_pages / nb_shards)
+        shards = [
+            [start, min(start + size, nb_pages)] for start in range(0, nb_pages, size)
+        ]
+        shards[-1][1] = None
+        return [tuple(shard) for shard in shards]
+
+    def run_shard(self, start_page, end_page, dry_run=False):
+        """
+        Import the pages from `start_page` to `end_page` (excluded) without
+        saving the history (nor checkpoints): it is saved once for all the
+        shards by `save_sharded_history`. Return the number of imported rows
+        """
+        self.start_page, self.end_page = start_page, end_page
+        self.progress_bar = False
+        # the shards push their metrics in distinct groups
+        self.metrics.grouping_key["shard"] = str(start_page)
+        self.run(dry_run=dry_run, history=False)
+        return self.nb_row_imported
+
+    def save_sharded_history(self, nb_row_imported, start_date):
+        self.nb_row_imported = nb_row_imported
+        self.start_date = start_date
+        self.save_history()
+
+    def run_sharded(self, nb_shards, dry_run=False, from_cache=False):
+        """
+        Import the source with `nb_shards` local processes
+        """
+        start_date = datetime.now()
+        shards = self.shards(nb_shards)
+        click.secho(f"Import {self.name} in {len(shards)} shard(s)", fg="green")
+        # the forked processes must open their own database connections
+        db.session.commit()
+        db.engine.dispose()
+        with ProcessPoolExecutor(
+            max_workers=len(shards), mp_context=multiprocessing.get_context("fork")
+        ) as executor:
+            futures = [
+                executor.submit(
+                    _run_shard, type(self), start, end, dry_run, from_cache
+                )
+                for start, end in shards
+            ]
+            nb_row_imported = sum(future.result() for future in futures)
+        if not dry_run:
+            self.save_sharded_history(nb_row_imported, start_date)
+        click.secho(f"Successfully import {nb_row_imported} row(s)", fg="green")
 
 
 class WFSParser(Parser):
     layer: str
     wfs_version: str
+    # nomenclature columns are taken as is from the features
+    resolve_nomenclature_codes = False
+    # read the GetFeature responses incrementally instead of loading them at once
+    stream = False
+    # number of features by GetFeature request (WFS 2.0 startIndex/count paging)
+    page_size: int = None
+    # ask the number of features (resultType=hits) before paging
+    use_hits = True
+    _parsed_root = None
+    indexed_feature = None
 
     @property
     def sub_items(self):
@@ -235,7 +1076,12 @@ class WFSParser(Parser):
 
     @property
     def items(self):
-        return ET.fromstring(self.root.text)
+        # parse the response only once
+        if self._parsed_root is not self.root:
+            with self.stats.timer("parse"):
+                self._tree = ET.fromstring(self.root.text)
+            self._parsed_root = self.root
+        return self._tree
 
     def get_xml_value(self, parent_tag, xml_key):
         new_tag = parent_tag.find(".//{*}" + xml_key)
@@ -244,35 +1090,52 @@ class WFSParser(Parser):
         else:
             return new_tag.text
 
+    def index_feature(self, feature):
+        """
+        Walk the feature once and keep the text of the first tag of each
+        mapped field and the tag containing the geometry
+        """
+        values = {}
+        geometry_parent_tag = None
+        tags = self.indexed_tags
+        elements = feature.iter()
+        next(elements)  # the feature itself
+        for elem in elements:
+            name = local_name(elem.tag)
+            if name in tags and name not in values:
+                values[name] = elem.text
+            if geometry_parent_tag is None and name == self.geometry_parent_name:
+                geometry_parent_tag = elem
+        self.indexed_feature = feature
+        self.feature_values = values
+        self.feature_geometry_parent_tag = geometry_parent_tag
+
+    def get_indexed_value(self, feature, xml_key):
+        if self.indexed_feature is not feature:
+            self.index_feature(feature)
+        return self.feature_values.get(xml_key)
+
     def get_geom(self, xml_feature):
+        if self.indexed_feature is not xml_feature:
+            self.index_feature(xml_feature)
         # the tag containing the gml
-        geometry_parent_tag = xml_feature.find(
-            ".//{*}" + self.mapping[self.geometry_col]
-        )
-        if geometry_parent_tag:
-            geometry_tag = None
-            for geometry_type in ("Point", "LineString", "Polygon"):
-                geometry_tag = geometry_parent_tag.find(".//{*}" + geometry_type)
-                if geometry_tag:
-                    break
-            if geometry_tag is not None:
-                geom = pygml.parse(
-                    ET.tostring(geometry_tag, encoding="unicode", method="xml")
-                )
-                shapely_geom = shape(geom.geometry)
-                return from_shape(shapely_geom, srid=self.srid)
-            else:
-                print("Geometry tag not found for this feature")
-                return None
-        print(f"Tag containning geometry ({self.mapping[self.geometry_col]}) not found")
+        geometry_parent_tag = self.feature_geometry_parent_tag
+        if geometry_parent_tag is not None:
+            elements = geometry_parent_tag.iter()
+            next(elements)
+            for geometry_tag in elements:
+                if local_name(geometry_tag.tag) in GEOMETRY_TYPES:
+                    return from_shape(gml_to_shapely(geometry_tag), srid=self.srid)
+            print("Geometry tag not found for this feature")
+            return None
+        print(f"Tag containning geometry ({self.geometry_parent_name}) not found")
         return None
 
-    def next_row(self):
-        """
-        The WFS parser do not implement pagination as WFS is a mess !!
-        It fetch all the stream at once. Maybe won't work for big data quantity
-        """
+    @property
+    def paging_enabled(self):
+        return bool(self.page_size) and self.wfs_version in ("2.0.0", "2.0.1")
 
+    def get_feature_filters(self, start_index=None, count=None):
         count_or_max_feature = (
             "count" if self.wfs_version in ("2.0.0", "2.0.1") else "maxFeatures"
         )
@@ -282,11 +1145,113 @@ class WFSParser(Parser):
             "TYPENAME": self.layer,
             "service": "WFS",
         }
-        if self.limit:
-            api_filters[count_or_max_feature] = self.limit
-        self.root = self.request_or_retry(self.url, params=api_filters)
-        for xml_node in self.items:
+        if count:
+            api_filters[count_or_max_feature] = count
+        if start_index is not None:
+            api_filters["startIndex"] = start_index
+        return api_filters
+
+    def hits(self):
+        """
+        Return the number of features of the layer (resultType=hits) or None
+        if the server does not give it
+        """
+        response = self.request_or_retry(
+            self.url, params={**self.get_feature_filters(), "resultType": "hits"}
+        )
+        return self.parse_hits(response.content)
+
+    def parse_hits(self, content):
+        root = ET.fromstring(content)
+        for attribute in ("numberMatched", "numberOfFeatures"):
+            value = root.get(attribute)
+            if value and value != "unknown":
+                return int(value)
+        return None
+
+    def iter_members(self, response):
+        """
+        Yield the children of the root of the response (the feature members)
+        while reading the response. Each member is detached from the root
+        once processed, so it is freed when the writer does not need it
+        anymore (after its chunk): the memory does not depend on the size of
+        the response. It is not cleared, a row rejected by the writer is
+        serialized from it
+        """
+        response.raw.decode_content = True
+        root = None
+        depth = 0
+        for event, elem in ET.iterparse(response.raw, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = elem
+                depth += 1
+                continue
+            depth -= 1
+            if depth == 1:
+                yield elem
+                root.remove(elem)
+
+    def features(self, response):
+        self.root = response
+        if self.stream:
+            members = self.stats.timed_iter(self.iter_members(response), "parse")
+        else:
+            members = self.items
+        for xml_node in members:
+            if local_name(xml_node.tag) == "boundedBy":
+                continue
             yield xml_node
+        if self.stream:
+            self.stats.incr("nb_bytes", response_size(response))
+
+    def next_row(self, page=0):
+        """
+        Without `page_size` the whole layer is fetched with one GetFeature
+        request (use `stream` for big layers).
+        With `page_size` (WFS 2.0 only) the layer is fetched by pages
+        of `page_size` features using startIndex/count
+        """
+        if not self.paging_enabled:
+            if page:
+                # the layer was already imported by the resumed run
+                return
+            response = self.request_or_retry(
+                self.url,
+                params=self.get_feature_filters(count=self.limit),
+                stream=self.stream,
+            )
+            nb_features = 0
+            for xml_node in self.features(response):
+                nb_features += 1
+                yield xml_node
+            self.page_done(0, nb_features)
+            return
+
+        total = self.hits() if self.use_hits else None
+        if self.limit:
+            total = min(total, self.limit) if total is not None else self.limit
+        self.total = total
+        start_index = page * self.page_size
+        while total is None or start_index < total:
+            count = (
+                self.page_size
+                if total is None
+                else min(self.page_size, total - start_index)
+            )
+            response = self.request_or_retry(
+                self.url,
+                params=self.get_feature_filters(start_index, count),
+                stream=self.stream,
+            )
+            nb_features = 0
+            for xml_node in self.features(response):
+                nb_features += 1
+                yield xml_node
+            self.page_done(start_index // self.page_size, nb_features)
+            if nb_features < count:
+                break
+            start_index += count
 
     def late_filter_feature(self, feature):
         """
@@ -296,26 +1261,22 @@ class WFSParser(Parser):
         """
         return True
 
+    def value_getter(self, xml_key):
+        self.indexed_tags.add(xml_key)
+        return lambda feature: self.get_indexed_value(feature, xml_key)
+
+    def compile_mapping(self):
+        # tags read from the features, filled by `value_getter`
+        self.indexed_tags = set()
+        self.geometry_parent_name = self.mapping.get(self.geometry_col)
+        # the geometry column is filled by `get_geom`
+        return compile_mapping(self, exclude=(self.geometry_col,))
+
     def build_object(self, row):
         self.row_root = row
-        synthese_dict_value = {}
         if not self.late_filter_feature(self.sub_items):
             return
-        for gn_col, const_value in self.constant_fields.items():
-            self.mapping.pop(gn_col, None)
-            synthese_dict_value[gn_col] = const_value
-        for gn_col, _func in self.dynamic_fields.items():
-            self.mapping.pop(gn_col, None)
-            synthese_dict_value[gn_col] = _func(self.sub_items)
-        if self.additionnal_fields:
-            for add_field, xml_key in self.additionnal_fields.items():
-                self.mapping.pop(add_field, None)
-                synthese_dict_value.setdefault("additional_data", {})[
-                    add_field
-                ] = self.get_xml_value(self.sub_items, xml_key)
-        for gn_col, xml_key in self.mapping.items():
-            val = self.get_xml_value(self.sub_items, xml_key)
-            synthese_dict_value[gn_col] = val
+        synthese_dict_value = self.compiled_mapping.apply(self.sub_items)
         # geom
         wkb_geom = self.get_geom(self.sub_items)
         if wkb_geom:
@@ -323,4 +1284,10 @@ class WFSParser(Parser):
                 synthese_dict_value, wkb_geom
             )
 
-        return Synthese(**synthese_dict_value)
+        return self.to_object(synthese_dict_value)
+
+    def serialize_row(self, row):
+        return {"xml": ET.tostring(row, encoding="unicode")}
+
+    def deserialize_row(self, payload):
+        return ET.fromstring(payload["xml"])
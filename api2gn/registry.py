@@ -0,0 +1,71 @@
+"""
+Registry of the parser classes by name.
+
+Parser classes with a `name` register themselves when their module is
+imported (see `Parser.__init_subclass__`), and the modules are only imported
+when a parser is needed:
+    - parsers declared as entry points of the `api2gn.parsers` group
+      (`<parser name> = package.module:ParserClass`): only the module of the
+      requested parser is imported
+    - parsers of `api2gn/var/config/parsers.py`: the module is imported when
+      the parser is not declared as entry point
+"""
+from functools import lru_cache
+from importlib import import_module
+from importlib.metadata import entry_points
+
+
+ENTRY_POINT_GROUP = "api2gn.parsers"
+CONFIG_MODULE = "api2gn.var.config.parsers"
+
+parsers = {}
+
+
+def register(parser_class):
+    parsers[parser_class.name] = parser_class
+    return parser_class
+
+
+@lru_cache(maxsize=None)
+def parser_entry_points():
+    eps = entry_points()
+    if hasattr(eps, "select"):
+        eps = eps.select(group=ENTRY_POINT_GROUP)
+    else:
+        eps = eps.get(ENTRY_POINT_GROUP, [])
+    return {ep.name: ep for ep in eps}
+
+
+@lru_cache(maxsize=None)
+def load_config_module():
+    try:
+        import_module(CONFIG_MODULE)
+    except ModuleNotFoundError as e:
+        # no parser configured, but errors of the module are raised
+        if e.name != CONFIG_MODULE:
+            raise
+
+
+def get_parser_class(name):
+    """
+    Return the parser class named `name` (importing its module if needed)
+    or None
+    """
+    if name in parsers:
+        return parsers[name]
+    entry_point = parser_entry_points().get(name)
+    if entry_point is not None:
+        # also known under the name of the entry point
+        parsers[name] = entry_point.load()
+        return parsers[name]
+    load_config_module()
+    return parsers.get(name)
+
+
+def parser_names():
+    """
+    Names of all the available parsers. The entry point modules are not
+    imported
+    """
+    load_config_module()
+    return sorted(set(parser_entry_points()) | set(parsers))
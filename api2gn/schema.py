@@ -1,10 +1,12 @@
 import sys
+import uuid
+from datetime import date
+from decimal import Decimal, InvalidOperation
 
 import click
+from sqlalchemy.sql import ClauseElement
 
-from sqlalchemy import inspect
-from sqlalchemy.sql.schema import Column
-from geonature.core.gn_synthese.models import Synthese
+from api2gn import cache
 
 
 class ValidationError(Exception):
@@ -16,20 +18,11 @@ class MappingValidator:
         self.schema = schema
 
     def validate(self, **kwargs):
-        mapper = inspect(Synthese)
-        # for c in mapper.columns:
-        #     print(dir(c))
-        not_null_synthese_col = set(
-            [
-                col.key
-                for col in mapper.columns
-                if type(col) is Column
-                and col.nullable is False
-                and col.primary_key is False
-            ]
-        )
-        all_synthese_cols = set([col.key for col in mapper.columns])
-        mapping_cols = set([key for key, value in self.schema.items()])
+        mapping_cols = frozenset(self.schema)
+        # only the columns are checked: a column set is validated once by process
+        if mapping_cols in cache.validated_mappings:
+            return
+        all_synthese_cols, not_null_synthese_col = cache.synthese_columns()
         # validate if mapping columns exist in synthese
         not_existing_cols = mapping_cols - all_synthese_cols
         if not_existing_cols:
@@ -44,3 +37,109 @@ class MappingValidator:
                 fg="red",
             )
             sys.exit()
+        cache.validated_mappings.add(mapping_cols)
+
+
+def _check_int(value, length):
+    if isinstance(value, (int, float, Decimal)):
+        return None
+    try:
+        int(str(value))
+    except ValueError:
+        return f"invalid integer {value!r}"
+
+
+def _check_number(value, length):
+    if isinstance(value, (int, float, Decimal)):
+        return None
+    try:
+        Decimal(str(value))
+    except InvalidOperation:
+        return f"invalid number {value!r}"
+
+
+def _check_str(value, length):
+    if length is not None and len(str(value)) > length:
+        return f"value too long ({len(str(value))} > {length} characters)"
+
+
+def _check_uuid(value, length):
+    if isinstance(value, uuid.UUID):
+        return None
+    try:
+        uuid.UUID(str(value))
+    except ValueError:
+        return f"invalid uuid {value!r}"
+
+
+def _check_date(value, length):
+    # the strings are parsed by the database (its date formats)
+    if not isinstance(value, (date, str)):
+        return f"invalid date {value!r}"
+
+
+CHECKS = (
+    # booleans are left to the database ("t", "yes"...)
+    (bool, None),
+    (int, _check_int),
+    ((float, Decimal), _check_number),
+    (str, _check_str),
+    (uuid.UUID, _check_uuid),
+    # and datetime
+    (date, _check_date),
+)
+
+
+def type_check(python_type):
+    if python_type is None:
+        return None
+    for base, check in CHECKS:
+        if issubclass(python_type, base):
+            return check
+    return None
+
+
+class RowValidator:
+    """
+    Check the built rows against the types and NOT NULL constraints of the
+    Synthese columns before they are written, so a bad row is rejected alone
+    instead of failing the insert of its whole chunk. What only the database
+    knows (foreign keys, date formats...) is checked when the chunk is written
+    """
+
+    def __init__(self, untyped_cols=()):
+        """
+        `untyped_cols`: columns whose values are not type-checked (ex: the
+        nomenclature codes resolved later by the writer)
+        """
+        untyped_cols = set(untyped_cols)
+        self.columns = {
+            col: (
+                None if col in untyped_cols else type_check(python_type),
+                length,
+                required,
+            )
+            for col, (python_type, length, required) in (
+                cache.synthese_column_types().items()
+            )
+        }
+
+    def validate(self, values):
+        """
+        Return the error of the row (dict of Synthese column values) or None
+        """
+        for col, value in values.items():
+            column = self.columns.get(col)
+            if column is None:
+                continue
+            check, length, required = column
+            if value is None:
+                if required:
+                    return f"{col}: null value in a NOT NULL column"
+                continue
+            if check is None or isinstance(value, ClauseElement):
+                continue
+            error = check(value, length)
+            if error:
+                return f"{col}: {error}"
+        return None
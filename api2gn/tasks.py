@@ -1,13 +1,84 @@
+import zlib
 from datetime import datetime, timedelta
+from urllib.parse import urlparse
 
+import sqlalchemy as sa
+from celery import chord
 from celery.schedules import crontab
+from celery.utils.log import get_task_logger
 
 from geonature.utils.celery import celery_app
+from geonature.utils.config import config
+from geonature.utils.env import db
 
 from api2gn.models import ParserModel
 from api2gn.utils import get_parser
 
 
+module_config = config["API2GN"]
+
+logger = get_task_logger(__name__)
+
+
+def _lock_namespace(name):
+    # advisory lock keys are int4
+    return zlib.crc32(name.encode()) & 0x7FFFFFFF
+
+
+class RunSlot:
+    """
+    PostgreSQL advisory locks held by a dedicated connection during a run:
+        - one lock by parser, so two workers never run the same parser
+        - one of PARSER_MAX_CONCURRENT_RUNS global slots
+        - one of PARSER_MAX_CONCURRENT_RUNS_PER_HOST slots of the source host
+    The shards of a sharded run take a global slot and one of the
+    `shard_slots` of their run instead of a slot of the host: they do not
+    wait for each other. The parser is marked as running
+    (`ParserModel.sharded_run_start`) until its last shard is done
+    """
+
+    def __init__(self, connection, parser_name, host):
+        self.connection = connection
+        self.parser_name = parser_name
+        self.host = host
+
+    def try_lock(self, namespace, key):
+        return self.connection.execute(
+            sa.select(sa.func.pg_try_advisory_lock(namespace, key))
+        ).scalar()
+
+    def try_slot(self, namespace, nb_slots):
+        return any(self.try_lock(namespace, slot) for slot in range(nb_slots))
+
+    def acquire(self, shard_slots=None):
+        """
+        Return None if the run (or the shard) can start, else the reason why
+        it can not
+        """
+        if shard_slots is None and not self.try_lock(
+            _lock_namespace("api2gn.parser"), _lock_namespace(self.parser_name)
+        ):
+            return "running"
+        if not self.try_slot(
+            _lock_namespace("api2gn.runs"), module_config["PARSER_MAX_CONCURRENT_RUNS"]
+        ):
+            return "busy"
+        if shard_slots is not None:
+            if not self.try_slot(
+                _lock_namespace(f"api2gn.shards.{self.parser_name}"), shard_slots
+            ):
+                return "busy"
+        elif self.host and not self.try_slot(
+            _lock_namespace(f"api2gn.host.{self.host}"),
+            module_config["PARSER_MAX_CONCURRENT_RUNS_PER_HOST"],
+        ):
+            return "busy"
+        return None
+
+    def release(self):
+        self.connection.execute(sa.select(sa.func.pg_advisory_unlock_all()))
+
+
 @celery_app.on_after_finalize.connect
 def setup_periodic_tasks(sender, **kwargs):
     sender.add_periodic_task(
@@ -19,19 +90,141 @@ def setup_periodic_tasks(sender, **kwargs):
 
 @celery_app.task(bind=True)
 def run_parsers(self):
-    for parser_db in ParserModel.query.filter(
-        ParserModel.schedule_frequency.isnot(None)
-    ).all():
-        if (
-            not parser_db.last_import
-            or (datetime.now() - parser_db.last_import).days
-            > parser_db.schedule_frequency
-        ):
-            run_one_parser.delay(parser_db.name)
+    parsers_db = [
+        parser_db
+        for parser_db in ParserModel.query.filter(
+            ParserModel.schedule_frequency.isnot(None)
+        ).all()
+        if not parser_db.last_import
+        or (datetime.now() - parser_db.last_import).days
+        > parser_db.schedule_frequency
+    ]
+    # longest imports first (never run ones are considered as the longest)
+    # so they do not end the nightly window
+    parsers_db.sort(
+        key=lambda parser_db: -(parser_db.last_import_duration or float("inf"))
+    )
+    for parser_db in parsers_db:
+        run_one_parser.delay(parser_db.name)
+
+
+def _source_host(Parser):
+    return urlparse(getattr(Parser, "url", "") or "").hostname
+
+
+def _sharded_run_pending(parser_name):
+    """
+    Return True if the shards of the last run of the parser are not all
+    done. A run older than PARSER_SHARDED_RUN_TIMEOUT (hours) is considered
+    lost (ex: a worker was killed), the parser can be run again
+    """
+    parser_db = ParserModel.query.filter_by(name=parser_name).one_or_none()
+    if parser_db is None or parser_db.sharded_run_start is None:
+        return False
+    timeout = timedelta(hours=module_config["PARSER_SHARDED_RUN_TIMEOUT"])
+    if datetime.now() - parser_db.sharded_run_start > timeout:
+        logger.warning(
+            "The sharded run of %s started at %s never ended, run it again",
+            parser_name,
+            parser_db.sharded_run_start,
+        )
+        return False
+    logger.info(
+        "Skip %s: the shards of its run started at %s are not all done",
+        parser_name,
+        parser_db.sharded_run_start,
+    )
+    return True
 
 
 @celery_app.task(bind=True)
 def run_one_parser(self, parser_name):
     Parser = get_parser(parser_name)
-    if Parser:
-        Parser().run()
+    if not Parser:
+        return
+    with db.engine.connect() as connection:
+        slot = RunSlot(connection, parser_name, _source_host(Parser))
+        try:
+            reason = slot.acquire()
+            if reason is None and _sharded_run_pending(parser_name):
+                # the shards of the previous run are still writing
+                reason = "running"
+            if reason is None:
+                if getattr(Parser, "nb_shards", None):
+                    run_sharded(Parser, parser_name)
+                else:
+                    Parser().run()
+        finally:
+            slot.release()
+    if reason == "busy":
+        # wait for a free slot
+        raise self.retry(
+            countdown=module_config["PARSER_SCHEDULER_RETRY_DELAY"], max_retries=None
+        )
+
+
+def run_sharded(Parser, parser_name):
+    """
+    Dispatch the shards of the parser as subtasks, the history of the parser
+    is saved once all the shards are done
+    """
+    start_date = datetime.now()
+    parser = Parser()
+    shards = parser.shards(Parser.nb_shards)
+    # released by `finish_sharded_run` (or `release_sharded_run` on failure)
+    parser.parser_obj.sharded_run_start = start_date
+    db.session.commit()
+    try:
+        chord(
+            run_parser_shard.s(parser_name, start_page, end_page)
+            for start_page, end_page in shards
+        )(
+            finish_sharded_run.s(parser_name, start_date.isoformat()).on_error(
+                release_sharded_run.si(parser_name)
+            )
+        )
+    except Exception:
+        release_sharded_run(parser_name)
+        raise
+
+
+@celery_app.task(bind=True)
+def run_parser_shard(self, parser_name, start_page, end_page):
+    Parser = get_parser(parser_name)
+    with db.engine.connect() as connection:
+        slot = RunSlot(connection, parser_name, _source_host(Parser))
+        try:
+            reason = slot.acquire(
+                shard_slots=Parser.shard_concurrency or Parser.nb_shards
+            )
+            if reason is None:
+                return Parser().run_shard(start_page, end_page)
+        finally:
+            slot.release()
+    # wait for a free slot
+    raise self.retry(
+        countdown=module_config["PARSER_SCHEDULER_RETRY_DELAY"], max_retries=None
+    )
+
+
+@celery_app.task(bind=True)
+def finish_sharded_run(self, nb_rows, parser_name, start_date):
+    Parser = get_parser(parser_name)
+    try:
+        Parser().save_sharded_history(
+            sum(nb_rows), datetime.fromisoformat(start_date)
+        )
+    finally:
+        release_sharded_run(parser_name)
+
+
+@celery_app.task(bind=True)
+def release_sharded_run(self, parser_name):
+    """
+    Mark the sharded run of the parser as done
+    """
+    db.session.rollback()
+    ParserModel.query.filter_by(name=parser_name).update(
+        {"sharded_run_start": None}
+    )
+    db.session.commit()
@@ -0,0 +1,92 @@
+"""
+Resume of an import interrupted in the middle of the source
+(needs the GeoNature test database)
+"""
+import pytest
+
+pytest.importorskip("geonature")
+
+from geonature.tests.fixtures import *  # noqa: F401,F403
+
+from api2gn.parsers import Parser
+from api2gn.writers import BulkWriter
+
+
+class Crash(Exception):
+    pass
+
+
+class MemoryWriter(BulkWriter):
+    """
+    Keep the committed rows in memory instead of the synthese
+    """
+
+    written = []
+
+    def write_chunk(self, chunk):
+        self.pending_chunk = [row["nom_cite"] for row in chunk]
+
+    def commit(self):
+        super().commit()
+        self.written.extend(getattr(self, "pending_chunk", []))
+        self.pending_chunk = []
+
+
+def make_parser(pages, crash_after=None):
+    class PagedParser(Parser):
+        name = "test_checkpoint"
+        description = "Checkpoint test"
+        mapping = {"nom_cite": "nom"}
+        writer_class = MemoryWriter
+        chunk_size = 5
+        dedup_key = None
+        progress_bar = False
+
+        def next_row(self, page=0):
+            nb_rows = 0
+            for page in range(page, len(pages)):
+                for row in pages[page]:
+                    if nb_rows == crash_after:
+                        raise Crash()
+                    nb_rows += 1
+                    yield row
+                self.page_done(page, len(pages[page]))
+
+        def build_object(self, row):
+            return {"nom_cite": row["nom"]}
+
+    return PagedParser()
+
+
+def source(nb_pages, page_size):
+    return [
+        [{"nom": f"{page}-{row}"} for row in range(page_size)]
+        for page in range(nb_pages)
+    ]
+
+
+@pytest.mark.usefixtures("temporary_transaction")
+@pytest.mark.parametrize(
+    "pages,crash_after",
+    [
+        # the chunk is committed on the last row of a page, before its end
+        (source(3, 10), 10),
+        # in the middle of a page
+        (source(3, 10), 13),
+        (source(3, 10), 27),
+        # layer of a single page (unpaged WFS)
+        (source(1, 30), 17),
+    ],
+)
+def test_resume_imports_each_row_once(pages, crash_after):
+    MemoryWriter.written = []
+    with pytest.raises(Crash):
+        make_parser(pages, crash_after).run()
+    # only the committed chunks are kept
+    assert len(MemoryWriter.written) == crash_after // 5 * 5
+
+    parser = make_parser(pages)
+    parser.run()
+    expected = [row["nom"] for page in pages for row in page]
+    assert MemoryWriter.written == expected
+    assert parser.nb_row_imported == len(expected)
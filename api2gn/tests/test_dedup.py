@@ -0,0 +1,96 @@
+import pytest
+
+from api2gn.dedup import BloomDedupIndex, BloomFilter, DedupIndex, key_digest
+
+
+def keys(nb):
+    return [(i, f"2024-01-{i % 28 + 1:02d}") for i in range(nb)]
+
+
+def test_dedup_index_finds_repeated_keys():
+    index = DedupIndex()
+    assert not any(index.add(key_digest(key), key) for key in keys(1000))
+    assert all(index.add(key_digest(key), key) for key in keys(1000))
+    # values are compared as text: 1 and "1" are the same key
+    assert index.add(key_digest(("0", "2024-01-01")))
+
+
+def test_dedup_index_preload():
+    index = DedupIndex()
+    index.preload(key_digest(("a",)))
+    assert index.add(key_digest(("a",)))
+    assert not index.add(key_digest(("b",)))
+
+
+def may_contain(bloom, digest):
+    return all(
+        bloom.bits[position // 8] & (1 << position % 8)
+        for position in bloom.positions(digest)
+    )
+
+
+@pytest.mark.parametrize("capacity,error_rate", [(1000, 0.01), (10, 0.001)])
+def test_bloom_filter_no_false_negative(capacity, error_rate):
+    bloom = BloomFilter(capacity, error_rate)
+    digests = [key_digest(key) for key in keys(capacity)]
+    for digest in digests:
+        bloom.add(digest)
+    assert all(bloom.add(digest) for digest in digests)
+
+
+def test_bloom_filter_error_rate():
+    bloom = BloomFilter(10_000, 0.01)
+    for key in keys(10_000):
+        bloom.add(key_digest(key))
+    false_positives = sum(
+        may_contain(bloom, key_digest(("other", i))) for i in range(10_000)
+    )
+    assert false_positives < 150
+
+
+class WrittenKeys:
+    """
+    Keys recorded with the written chunks, as in `api2gn.dedup_key`
+    """
+
+    def __init__(self):
+        self.keys = set()
+        self.lookups = 0
+
+    def __call__(self, key):
+        self.lookups += 1
+        return key in self.keys
+
+
+def test_bloom_index_confirms_hits():
+    written = WrittenKeys()
+    # a saturated filter: every key is a possible hit
+    index = BloomDedupIndex(1, 0.5, written)
+    index.bloom.bits[:] = b"\xff" * len(index.bloom.bits)
+
+    assert not index.add(key_digest(("a",)), ("a",))
+    assert not index.add(key_digest(("b",)), ("b",))
+    # the false positives were checked against the written keys
+    assert written.lookups == 2
+    # a key not written yet is found among the pending ones
+    assert index.add(key_digest(("a",)), ("a",))
+    assert written.lookups == 2
+
+    assert index.pending_keys() == [("a",), ("b",)]
+    written.keys.update(index.pending_keys())
+    index.chunk_written()
+    assert index.pending_keys() == []
+    assert index.add(key_digest(("b",)), ("b",))
+    assert not index.add(key_digest(("c",)), ("c",))
+
+
+def test_bloom_index_preload():
+    written = WrittenKeys()
+    written.keys.add(("a",))
+    index = BloomDedupIndex(100, 0.01, written)
+    index.preload(key_digest(("a",)))
+    assert index.add(key_digest(("a",)), ("a",))
+    # a key never seen is not looked up
+    lookups = written.lookups
+    assert not index.add(key_digest(("z",)), ("z",))
+    assert written.lookups == lookups
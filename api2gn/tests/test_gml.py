@@ -0,0 +1,119 @@
+import xml.etree.ElementTree as ET
+
+import pytest
+
+pytest.importorskip("shapely")
+
+from api2gn import gml
+from api2gn.gml import YX_EPSG_CODES, gml_to_shapely
+
+
+GML2 = 'xmlns:gml="http://www.opengis.net/gml"'
+GML32 = 'xmlns:gml="http://www.opengis.net/gml/3.2"'
+
+GEOMETRIES = [
+    # GML 3, latitude first
+    f"""<gml:Point {GML32} srsName="urn:ogc:def:crs:EPSG::4326">
+        <gml:pos>45.1 5.7</gml:pos></gml:Point>""",
+    f"""<gml:Point {GML32} srsName="http://www.opengis.net/def/crs/EPSG/0/4258">
+        <gml:pos>45.1 5.7</gml:pos></gml:Point>""",
+    # projected, northing first
+    f"""<gml:LineString {GML32} srsName="urn:ogc:def:crs:EPSG::3035">
+        <gml:posList>2800000 3900000 2800100 3900200</gml:posList></gml:LineString>""",
+    f"""<gml:LineString {GML32} srsName="urn:ogc:def:crs:EPSG::3034">
+        <gml:posList>2800000 3900000 2800100 3900200</gml:posList></gml:LineString>""",
+    # projected, easting first
+    f"""<gml:LineString {GML32} srsName="urn:ogc:def:crs:EPSG::2154">
+        <gml:posList>900000 6400000 900100 6400200</gml:posList></gml:LineString>""",
+    # polygon with a hole
+    f"""<gml:Polygon {GML32} srsName="urn:ogc:def:crs:EPSG::4326">
+        <gml:exterior><gml:LinearRing>
+            <gml:posList>0 0 0 10 10 10 10 0 0 0</gml:posList>
+        </gml:LinearRing></gml:exterior>
+        <gml:interior><gml:LinearRing>
+            <gml:posList>2 2 2 4 4 4 4 2 2 2</gml:posList>
+        </gml:LinearRing></gml:interior>
+    </gml:Polygon>""",
+    f"""<gml:MultiPoint {GML32} srsName="urn:ogc:def:crs:EPSG::4326">
+        <gml:pointMember><gml:Point><gml:pos>45 5</gml:pos></gml:Point></gml:pointMember>
+        <gml:pointMember><gml:Point><gml:pos>46 6</gml:pos></gml:Point></gml:pointMember>
+    </gml:MultiPoint>""",
+]
+
+
+@pytest.mark.parametrize("source", GEOMETRIES)
+def test_same_geometry_as_pygml(source):
+    """
+    The conversion gives the geometries of the former pygml conversion
+    """
+    pygml = pytest.importorskip("pygml")
+    from shapely.geometry import shape
+
+    expected = shape(pygml.parse(source).geometry)
+    assert gml_to_shapely(ET.fromstring(source)).equals_exact(expected, 0)
+
+
+# not supported by pygml
+def test_gml2_coordinates():
+    multi = gml_to_shapely(
+        ET.fromstring(
+            f"""<gml:MultiPolygon {GML2} srsName="EPSG:2154">
+            <gml:polygonMember><gml:Polygon><gml:outerBoundaryIs><gml:LinearRing>
+                <gml:coordinates>0,0 0,1 1,1 1,0 0,0</gml:coordinates>
+            </gml:LinearRing></gml:outerBoundaryIs></gml:Polygon></gml:polygonMember>
+            <gml:polygonMember><gml:Polygon><gml:outerBoundaryIs><gml:LinearRing>
+                <gml:coordinates>5,5 5,6 6,6 6,5 5,5</gml:coordinates>
+            </gml:LinearRing></gml:outerBoundaryIs></gml:Polygon></gml:polygonMember>
+        </gml:MultiPolygon>"""
+        )
+    )
+    assert [polygon.bounds for polygon in multi.geoms] == [(0, 0, 1, 1), (5, 5, 6, 6)]
+
+
+def test_pos_list_dimension():
+    line = gml_to_shapely(
+        ET.fromstring(
+            f"""<gml:LineString {GML32} srsDimension="3">
+            <gml:posList>900000 6400000 10 900100 6400200 20</gml:posList>
+            </gml:LineString>"""
+        )
+    )
+    assert list(line.coords) == [(900000, 6400000, 10), (900100, 6400200, 20)]
+
+
+def test_latitude_first():
+    point = gml_to_shapely(
+        ET.fromstring(
+            f"""<gml:Point {GML32} srsName="urn:ogc:def:crs:EPSG::3035">
+            <gml:pos>2800000 3900000</gml:pos></gml:Point>"""
+        )
+    )
+    assert (point.x, point.y) == (3900000, 2800000)
+
+
+def test_short_srs_name_is_xy():
+    # "EPSG:xxxx" is the x/y form of the WFS 1.0 servers
+    point = gml_to_shapely(
+        ET.fromstring(
+            f"""<gml:Point {GML2} srsName="EPSG:4326">
+            <gml:coordinates>5.7,45.1</gml:coordinates></gml:Point>"""
+        )
+    )
+    assert (point.x, point.y) == (5.7, 45.1)
+
+
+def test_fallback_codes(monkeypatch):
+    monkeypatch.setattr(gml, "CRS", None)
+    gml.is_yx_epsg.cache_clear()
+    try:
+        assert gml.is_yx_epsg(3034) and gml.is_yx_epsg(3035)
+        assert not gml.is_yx_epsg(2154)
+    finally:
+        gml.is_yx_epsg.cache_clear()
+
+
+def test_fallback_codes_match_pyproj():
+    pyproj = pytest.importorskip("pyproj")
+    for code in YX_EPSG_CODES:
+        axis = pyproj.CRS.from_epsg(code).axis_info
+        assert axis[0].direction.lower() == "north", code
@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+pytest.importorskip("requests")
+
+from api2gn.http_cache import ResponseCache
+
+
+class FakeResponse:
+    def __init__(self, body, url="http://source/api"):
+        self.body = body
+        self.url = url
+        self.headers = {"ETag": '"v1"', "Content-Encoding": "gzip"}
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.body), chunk_size):
+            yield self.body[start : start + chunk_size]
+
+
+def bodies_size(cache):
+    return sum(
+        os.path.getsize(os.path.join(cache.bodies_dir, name))
+        for name in os.listdir(cache.bodies_dir)
+    )
+
+
+def test_store_and_replay(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_size=1024 * 1024)
+    cache.store("http://source/api", {"page": 1}, FakeResponse(b'{"items": []}'))
+    entry = cache.get("http://source/api", {"page": 1})
+    assert cache.get("http://source/api", {"page": 2}) is None
+    assert entry["headers"] == {"etag": '"v1"'}
+    assert cache.validators(entry) == {"If-None-Match": '"v1"'}
+    assert cache.response(entry).content == b'{"items": []}'
+
+
+def test_streamed_response_closed_once_read(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_size=1024 * 1024)
+    entry = cache.store("http://source/api", None, FakeResponse(b"x" * 100_000))
+    response = cache.response(entry, stream=True)
+    assert len(response.raw.read(1000)) == 1000
+    assert not response.raw.closed
+    while response.raw.read(1000):
+        pass
+    assert response.raw.closed
+
+
+def test_evict_least_recently_used(tmp_path):
+    # incompressible bodies of about 40 kB
+    bodies = [os.urandom(40_000) for _ in range(3)]
+    cache = ResponseCache(str(tmp_path), max_size=100_000)
+    for page, body in enumerate(bodies[:2]):
+        cache.store("http://source/api", {"page": page}, FakeResponse(body))
+    # page 0 is used again: page 1 is the least recently used
+    assert cache.get("http://source/api", {"page": 0}) is not None
+    cache.store("http://source/api", {"page": 2}, FakeResponse(bodies[2]))
+
+    assert cache.get("http://source/api", {"page": 1}) is None
+    assert cache.get("http://source/api", {"page": 0}) is not None
+    assert cache.get("http://source/api", {"page": 2}) is not None
+    # the running size matches the disk, below the limit
+    assert cache.size == bodies_size(cache) <= cache.max_size
+
+
+def test_identical_bodies_counted_once(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_size=1024 * 1024)
+    for page in range(3):
+        cache.store("http://source/api", {"page": page}, FakeResponse(b"same" * 1000))
+    assert cache.size == bodies_size(cache)
+    assert len(os.listdir(cache.bodies_dir)) == 1
@@ -0,0 +1,101 @@
+import operator
+from types import SimpleNamespace
+
+import pytest
+
+click = pytest.importorskip("click")
+
+from api2gn.mapping import compile_mapping
+
+
+class FakeNomenclatures:
+    def resolve(self, mnemonique_type, code):
+        return f"{mnemonique_type}:{code}"
+
+
+def make_parser(**attributes):
+    return SimpleNamespace(
+        **{
+            "constant_fields": {},
+            "dynamic_fields": {},
+            "mapping": {},
+            "additionnal_fields": {},
+            "resolve_nomenclature_codes": False,
+            "nomenclature_mapping": {},
+            "nomenclatures": FakeNomenclatures(),
+            "value_getter": operator.itemgetter,
+            **attributes,
+        }
+    )
+
+
+ROW = {"nom": "Vulpes vulpes", "nb": "3", "ref": 42, "statut": "Pr"}
+
+
+def test_mapping_fields_and_functions():
+    parser = make_parser(
+        mapping={
+            "nom_cite": "nom",
+            "count_min": {"key": "nb", "func": int},
+            "count_max": {"key": "nb"},
+        }
+    )
+    assert compile_mapping(parser).apply(ROW) == {
+        "nom_cite": "Vulpes vulpes",
+        "count_min": 3,
+        "count_max": "3",
+    }
+
+
+def test_precedence():
+    parser = make_parser(
+        constant_fields={"nom_cite": "constant", "id_source": 1},
+        dynamic_fields={"nom_cite": lambda row: row["nom"].upper()},
+        mapping={"nom_cite": "ref", "id_source": "ref", "cd_nom": "ref"},
+    )
+    assert compile_mapping(parser).apply(ROW) == {
+        "nom_cite": "VULPES VULPES",
+        "id_source": 1,
+        "cd_nom": 42,
+    }
+
+
+def test_additional_fields_and_exclude():
+    parser = make_parser(
+        mapping={"nom_cite": "nom", "reference": "ref", "the_geom_4326": "geom"},
+        additionnal_fields={"reference": "ref"},
+    )
+    compiled = compile_mapping(parser, exclude=("the_geom_4326",))
+    # the excluded column is never read from the row
+    assert compiled.apply(ROW) == {
+        "nom_cite": "Vulpes vulpes",
+        "additional_data": {"reference": 42},
+    }
+
+
+def test_each_row_gets_its_own_additional_data():
+    compiled = compile_mapping(make_parser(additionnal_fields={"reference": "ref"}))
+    first = compiled.apply(ROW)
+    second = compiled.apply({**ROW, "ref": 43})
+    assert first["additional_data"] == {"reference": 42}
+    assert second["additional_data"] == {"reference": 43}
+
+
+def test_nomenclature_codes():
+    parser = make_parser(
+        mapping={"id_nomenclature_bio_status": "statut", "nom_cite": "nom"},
+        resolve_nomenclature_codes=True,
+        nomenclature_mapping={"id_nomenclature_bio_status": "STATUT_BIO"},
+    )
+    assert compile_mapping(parser).apply(ROW) == {
+        "id_nomenclature_bio_status": "STATUT_BIO:Pr",
+        "nom_cite": "Vulpes vulpes",
+    }
+
+
+def test_missing_nomenclature_type():
+    parser = make_parser(
+        mapping={"id_nomenclature_sex": "sexe"}, resolve_nomenclature_codes=True
+    )
+    with pytest.raises(click.ClickException):
+        compile_mapping(parser)
@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+
+import pytest
+
+from api2gn.pagination import (
+    KeysetPagination,
+    NextLinkPagination,
+    OffsetPagination,
+    PageNumberPagination,
+)
+
+
+PARSER = SimpleNamespace(limit=100)
+
+
+@pytest.mark.parametrize("paginator", [PageNumberPagination(), OffsetPagination()])
+def test_numbered_pages_end_on_short_page(paginator):
+    assert paginator.is_last_page(PARSER, 99, None, None)
+    assert not paginator.is_last_page(PARSER, 100, None, None)
+
+
+def test_keyset_short_page_is_not_last():
+    # the source caps the limit to 50
+    paginator = KeysetPagination("id", "id_gt")
+    assert not paginator.is_last_page(PARSER, 50, 10, 60)
+    assert paginator.is_last_page(PARSER, 0, 60, None)
+
+
+def test_keyset_ends_when_cursor_does_not_move():
+    # "greater or equal" source: the page only holds the previous last row
+    paginator = KeysetPagination("id", "id_gte")
+    items = [{"id": 60}]
+    next_cursor = paginator.next_cursor(PARSER, None, items)
+    assert paginator.filter_items(items, 60) == []
+    assert paginator.is_last_page(PARSER, len(items), 60, next_cursor)
+
+
+def test_next_link_ends_without_link():
+    paginator = NextLinkPagination()
+    root = {"next": None}
+    assert paginator.is_last_page(
+        PARSER, 20, "abc", paginator.next_cursor(PARSER, root, [{}] * 20)
+    )
+    root = {"next": "?page=3"}
+    assert not paginator.is_last_page(
+        PARSER, 20, "?page=2", paginator.next_cursor(PARSER, root, [{}] * 20)
+    )
@@ -0,0 +1,75 @@
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+from api2gn import cache
+from api2gn.mixins import NomenclatureMixin
+from api2gn.parsers import Parser
+from api2gn.writers import BulkWriter, StagingUpsertWriter, StagingWriter
+
+
+COLUMN_TYPES = {
+    "id_synthese": (int, None, False),
+    "unique_id_sinp": (uuid.UUID, None, False),
+    "nom_cite": (str, 10, True),
+    "cd_nom": (int, None, False),
+    "id_nomenclature_observation_status": (int, None, False),
+    "id_nomenclature_obj_count": (int, None, False),
+}
+
+
+@pytest.fixture(autouse=True)
+def column_types(monkeypatch):
+    monkeypatch.setattr(cache, "synthese_column_types", lambda: COLUMN_TYPES)
+
+
+def row_validator(writer_class):
+    parser = SimpleNamespace(
+        writer_class=writer_class,
+        nomenclature_mapping=NomenclatureMixin.nomenclature_mapping,
+    )
+    return Parser.make_row_validator(parser)
+
+
+def row(**values):
+    return {
+        "unique_id_sinp": str(uuid.uuid4()),
+        "nom_cite": "Taxon",
+        "cd_nom": 12,
+        **values,
+    }
+
+
+@pytest.mark.parametrize("writer_class", [StagingWriter, StagingUpsertWriter])
+def test_staging_writer_accepts_nomenclature_codes(writer_class):
+    validator = row_validator(writer_class)
+    assert (
+        validator.validate(
+            row(
+                id_nomenclature_observation_status="Pr",
+                id_nomenclature_obj_count="IND",
+            )
+        )
+        is None
+    )
+    # the other columns are still checked
+    assert validator.validate(row(cd_nom="abc")).startswith("cd_nom")
+    assert validator.validate(row(nom_cite=None)).startswith("nom_cite")
+
+
+def test_bulk_writer_checks_nomenclature_ids():
+    validator = row_validator(BulkWriter)
+    assert validator.validate(row(id_nomenclature_observation_status=85)) is None
+    assert validator.validate(row(id_nomenclature_observation_status="Pr")).startswith(
+        "id_nomenclature_observation_status"
+    )
+
+
+def test_row_validator_types():
+    validator = row_validator(BulkWriter)
+    assert validator.validate(row()) is None
+    assert validator.validate(row(unique_id_sinp="not an uuid")).startswith(
+        "unique_id_sinp"
+    )
+    assert "too long" in validator.validate(row(nom_cite="x" * 11))
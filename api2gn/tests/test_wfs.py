@@ -0,0 +1,27 @@
+import io
+import xml.etree.ElementTree as ET
+from types import SimpleNamespace
+
+from api2gn.parsers import WFSParser
+
+
+FEATURES = b"""<wfs:FeatureCollection xmlns:wfs="http://www.opengis.net/wfs/2.0"
+    xmlns:bench="http://api2gn/benchmark">
+    <wfs:member><bench:observation><bench:nom>A</bench:nom></bench:observation></wfs:member>
+    <wfs:member><bench:observation><bench:nom>B</bench:nom></bench:observation></wfs:member>
+</wfs:FeatureCollection>"""
+
+
+def test_streamed_members_kept_for_the_writer():
+    """
+    The members still held by the writer (pending chunk) can be serialized
+    in the dead-letter table once the response is read
+    """
+    response = SimpleNamespace(raw=io.BytesIO(FEATURES))
+    members = list(WFSParser.iter_members(None, response))
+    payloads = [WFSParser.serialize_row(None, member) for member in members]
+    names = [
+        ET.fromstring(payload["xml"]).find(".//{http://api2gn/benchmark}nom").text
+        for payload in payloads
+    ]
+    assert names == ["A", "B"]
@@ -1,25 +1,18 @@
-import inspect
-from importlib import import_module
 import click
 
+from api2gn import registry
+
 
 def list_parsers():
-    module = import_module("api2gn.var.config.parsers")
-    parsers = []
-    for name, obj in inspect.getmembers(module):
-        if hasattr(obj, "__module__"):
-            if obj.__module__ == "api2gn.var.config.parsers" and inspect.isclass(obj):
-                parsers.append(obj)
-    return parsers
+    """
+    Return all the parser classes (all their modules are imported)
+    """
+    return [registry.get_parser_class(name) for name in registry.parser_names()]
 
 
 def get_parser(name):
-    selected_parser = None
-    for parser in list_parsers():
-        if parser.name == name:
-            selected_parser = parser
+    selected_parser = registry.get_parser_class(name)
     if not selected_parser:
         click.secho(f"Cannot find parser {name}")
         return None
-    module = import_module("api2gn.var.config.parsers")
-    return getattr(module, selected_parser.__name__)
+    return selected_parser
@@ -0,0 +1,456 @@
+import csv
+import hashlib
+import io
+import json
+import time
+
+import click
+import sqlalchemy as sa
+from sqlalchemy import inspect, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql import ClauseElement
+from geoalchemy2.elements import WKBElement, WKTElement
+
+from geonature.core.gn_synthese.models import Synthese
+from geonature.utils.env import db
+
+from api2gn.models import RowHashModel
+
+
+def object_to_dict(obj):
+    """
+    Return the column values set on a `Synthese` instance
+    """
+    state = inspect(obj)
+    return {
+        attr.key: state.dict[attr.key]
+        for attr in state.mapper.column_attrs
+        if attr.key in state.dict
+    }
+
+
+def _hashable_value(value):
+    if isinstance(value, (WKBElement, WKTElement)):
+        return str(value.desc)
+    if isinstance(value, ClauseElement):
+        try:
+            return str(value.compile(compile_kwargs={"literal_binds": True}))
+        except Exception:
+            return str(value)
+    return str(value)
+
+
+def content_hash(row):
+    """
+    Return a hash of the values of a row (dict)
+    """
+    dump = json.dumps(row, sort_keys=True, default=_hashable_value)
+    return hashlib.blake2b(dump.encode(), digest_size=16).hexdigest()
+
+
+def json_value(value):
+    """
+    Return `value` with only JSON types (geometries and SQL expressions
+    as text), to be stored in a jsonb column
+    """
+    return json.loads(json.dumps(value, default=_hashable_value))
+
+
+class ORMWriter:
+    """
+    Default writer: each object is added to the session. With the parser
+    `chunked_commit` the session is flushed, committed and emptied every
+    `chunk_size` rows so the memory does not grow with the import, else
+    everything is committed at the end of the import.
+    When the database refuses a chunk, its rows are written again one by one
+    in savepoints and the refused ones are rejected (see `Parser.reject`).
+    In dry run the chunks are written then rolled back
+    """
+
+    # does the writer expect plain column dicts from `build_object`
+    as_dict = False
+    # are nomenclature codes and derived geometries resolved by the writer
+    resolve_in_db = False
+    # are the existing rows updated (on the `upsert_key` of the parser)
+    upsert = False
+
+    def __init__(self, parser, dry_run=False, chunk_size=None):
+        self.parser = parser
+        self.dry_run = dry_run
+        self.chunk_size = chunk_size
+        self.chunked = parser.chunked_commit
+        # rows written since the last flush
+        self.nb_pending = 0
+        # (object, source row) of the pending rows
+        self.pending = []
+
+    def write(self, obj, row=None):
+        if isinstance(obj, dict):
+            obj = Synthese(**obj)
+        db.session.add(obj)
+        self.pending.append((obj, row))
+        self.row_written()
+
+    def row_written(self):
+        self.nb_pending += 1
+        # a chunk committed in the middle of a page saves the number of rows
+        # of the page already read with the checkpoint
+        if self.chunked and self.nb_pending >= self.chunk_size:
+            self.flush()
+
+    def page_done(self, page):
+        if self.chunked and self.nb_pending >= self.chunk_size:
+            self.flush()
+
+    def prepare(self):
+        """
+        Compute the columns filled by batch (`prepare_chunk` of the parser,
+        ex: the derived geometries) on the pending objects
+        """
+        rows = [object_to_dict(obj) for obj, _ in self.pending]
+        with self.parser.stats.timer("build"):
+            self.parser.prepare_chunk(rows)
+        for (obj, _), values in zip(self.pending, rows):
+            for col, value in values.items():
+                if obj.__dict__.get(col) is not value:
+                    setattr(obj, col, value)
+
+    def flush(self):
+        if not self.nb_pending:
+            return
+        self.prepare()
+        start = time.perf_counter()
+        with self.parser.stats.timer("write"):
+            try:
+                db.session.flush()
+            except sa.exc.StatementError:
+                db.session.rollback()
+                primary_keys = {col.key for col in Synthese.__mapper__.primary_key}
+                self.write_apart(
+                    (
+                        {
+                            col: value
+                            for col, value in object_to_dict(obj).items()
+                            if col not in primary_keys
+                        },
+                        row,
+                    )
+                    for obj, row in self.pending
+                )
+        self.pending = []
+        self.nb_pending = 0
+        self.commit()
+        # the written objects are not needed anymore
+        db.session.expunge_all()
+        self.parser.metrics.observe_flush(time.perf_counter() - start)
+
+    def write_rows(self, rows):
+        for values in rows:
+            db.session.add(Synthese(**values))
+
+    def write_apart(self, rows):
+        """
+        Write the (column values, source row) of a refused chunk one by one
+        """
+        for values, row in rows:
+            try:
+                with db.session.begin_nested():
+                    self.write_rows([values])
+            except sa.exc.StatementError as e:
+                self.parser.reject(row, e, "write", values)
+
+    def commit(self):
+        # the rejected rows, the deduplication keys and the checkpoint are
+        # committed with the chunk
+        self.parser.save_rejected()
+        self.parser.save_dedup_keys()
+        if self.dry_run:
+            db.session.rollback()
+        else:
+            with self.parser.stats.timer("write"):
+                self.parser.save_checkpoint()
+                db.session.commit()
+            self.parser.chunk_committed()
+
+    def close(self):
+        self.flush()
+        # rows rejected after the last chunk
+        if self.parser.rejected:
+            self.commit()
+
+    def report(self):
+        pass
+
+
+class BulkWriter(ORMWriter):
+    """
+    Collect plain column dicts and insert them in `gn_synthese.synthese`
+    with one multi-row INSERT per chunk, committing every `chunk_size` rows
+    """
+
+    as_dict = True
+
+    def __init__(self, parser, dry_run=False, chunk_size=None):
+        super().__init__(parser, dry_run=dry_run, chunk_size=chunk_size)
+        self.chunked = True
+        self.chunk = []
+        # source rows of the chunk
+        self.rows = []
+
+    def write(self, obj, row=None):
+        if isinstance(obj, Synthese):
+            obj = object_to_dict(obj)
+        self.chunk.append(obj)
+        self.rows.append(row)
+        self.row_written()
+
+    def write_rows(self, rows):
+        self.write_chunk(rows)
+
+    def write_chunk(self, chunk):
+        # a multi-row VALUES clause needs the same columns on every row:
+        # rows are grouped by column set (ex: rows without geometry)
+        groups = {}
+        for row in chunk:
+            groups.setdefault(frozenset(row), []).append(row)
+        table = Synthese.__table__
+        for rows in groups.values():
+            db.session.execute(table.insert().values(rows))
+
+    def flush(self):
+        if not self.chunk:
+            return
+        with self.parser.stats.timer("build"):
+            self.parser.prepare_chunk(self.chunk)
+        start = time.perf_counter()
+        with self.parser.stats.timer("write"):
+            try:
+                self.write_chunk(self.chunk)
+            except sa.exc.StatementError:
+                db.session.rollback()
+                self.write_apart(zip(self.chunk, self.rows))
+        self.chunk = []
+        self.rows = []
+        self.nb_pending = 0
+        self.commit()
+        self.parser.metrics.observe_flush(time.perf_counter() - start)
+
+
+class UpsertWriter(BulkWriter):
+    """
+    Insert or update the rows on a natural key (`upsert_key` of the parser)
+    with INSERT ... ON CONFLICT DO UPDATE. The key must be backed by a
+    unique index of `gn_synthese.synthese` (ex: `unique_id_sinp`).
+    A hash of each row is kept in `api2gn.row_hash`: the rows not changed
+    since the previous import are skipped
+    """
+
+    upsert = True
+
+    def __init__(self, parser, dry_run=False, chunk_size=None):
+        super().__init__(parser, dry_run=dry_run, chunk_size=chunk_size)
+        self.key = tuple(parser.upsert_key)
+        self.nb_row_unchanged = 0
+
+    def natural_key(self, row):
+        return "|".join(str(row.get(col)) for col in self.key)
+
+    def write_chunk(self, chunk):
+        id_parser = self.parser.parser_id
+        # a statement can not update the same row twice: keep the last version
+        rows = {self.natural_key(row): row for row in chunk}
+        hashes = {key: content_hash(row) for key, row in rows.items()}
+        known_hashes = dict(
+            db.session.execute(
+                select(RowHashModel.natural_key, RowHashModel.content_hash).where(
+                    RowHashModel.id_parser == id_parser,
+                    RowHashModel.natural_key.in_(list(hashes)),
+                )
+            ).all()
+        )
+        changed = [key for key, hash in hashes.items() if known_hashes.get(key) != hash]
+        self.nb_row_unchanged += len(chunk) - len(changed)
+        if not changed:
+            return
+
+        groups = {}
+        for key in changed:
+            groups.setdefault(frozenset(rows[key]), []).append(rows[key])
+        for columns, group in groups.items():
+            stmt = insert(Synthese.__table__).values(group)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=list(self.key),
+                set_={
+                    col: stmt.excluded[col] for col in columns if col not in self.key
+                },
+            )
+            db.session.execute(stmt)
+
+        stmt = insert(RowHashModel.__table__).values(
+            [
+                dict(id_parser=id_parser, natural_key=key, content_hash=hashes[key])
+                for key in changed
+            ]
+        )
+        db.session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["id_parser", "natural_key"],
+                set_={"content_hash": stmt.excluded.content_hash},
+            )
+        )
+
+    def report(self):
+        click.secho(f"{self.nb_row_unchanged} unchanged row(s) skipped", fg="green")
+
+
+def _staging_value(value):
+    if isinstance(value, WKBElement):
+        # hex WKB prefixed by its SRID, understood by the PostGIS geometry input
+        return value.desc if value.extended else f"SRID={value.srid};{value.desc}"
+    if isinstance(value, WKTElement):
+        return f"SRID={value.srid};{value.data}"
+    return str(value)
+
+
+class StagingWriter(BulkWriter):
+    """
+    Load each chunk with COPY in the unlogged table `api2gn.synthese_staging`
+    (rows stored as jsonb) then move it into `gn_synthese.synthese` with one
+    set-based statement, which also resolves the nomenclature codes (join on
+    `ref_nomenclatures.t_nomenclatures`, unknown codes give NULL) and the
+    derived geometries (ST_Transform / ST_Centroid).
+    With `upsert = True` the rows are merged on the `upsert_key` of the parser
+    """
+
+    resolve_in_db = True
+    upsert = False
+    GEOM_COLS = ("the_geom_4326", "the_geom_local", "the_geom_point")
+
+    def __init__(self, parser, dry_run=False, chunk_size=None):
+        super().__init__(parser, dry_run=dry_run, chunk_size=chunk_size)
+        self.synthese_cols = set(Synthese.__table__.c.keys())
+        mnemoniques = {
+            col: mnemonique
+            for col, mnemonique in parser.nomenclature_mapping.items()
+            if col in self.synthese_cols
+        }
+        id_types = dict(
+            db.session.execute(
+                sa.text(
+                    """
+                    SELECT mnemonique, id_type
+                    FROM ref_nomenclatures.bib_nomenclatures_types
+                    WHERE mnemonique IN :mnemoniques
+                    """
+                ).bindparams(sa.bindparam("mnemoniques", expanding=True)),
+                {"mnemoniques": list(set(mnemoniques.values()))},
+            ).all()
+        )
+        self.nomenclature_id_types = {
+            col: id_types[mnemonique]
+            for col, mnemonique in mnemoniques.items()
+            if mnemonique in id_types
+        }
+
+    def copy(self, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        id_parser = self.parser.parser_id
+        for row in rows:
+            writer.writerow([id_parser, json.dumps(row, default=_staging_value)])
+        buffer.seek(0)
+        cursor = db.session.connection().connection.cursor()
+        cursor.copy_expert(
+            "COPY api2gn.synthese_staging (id_parser, data) FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+
+    def merge_statement(self, columns):
+        nomenclature_cols = [c for c in columns if c in self.nomenclature_id_types]
+        with_geom = any(col in columns for col in self.GEOM_COLS)
+        insert_cols = [c for c in columns if c in self.synthese_cols]
+        if with_geom:
+            insert_cols += [c for c in self.GEOM_COLS if c not in insert_cols]
+        params = {
+            "id_parser": self.parser.parser_id,
+            "nomenclature_cols": nomenclature_cols,
+            "local_srid": self.parser.local_srid,
+        }
+
+        joins = []
+        select_exprs = []
+        for col in insert_cols:
+            if col in nomenclature_cols:
+                alias = f"n_{len(joins)}"
+                params[f"{alias}_id_type"] = self.nomenclature_id_types[col]
+                joins.append(
+                    f"""LEFT JOIN ref_nomenclatures.t_nomenclatures {alias}
+                    ON {alias}.id_type = :{alias}_id_type
+                    AND {alias}.cd_nomenclature = src.staging_data->>'{col}'"""
+                )
+                select_exprs.append(f"{alias}.id_nomenclature")
+            elif col == "the_geom_4326":
+                select_exprs.append(
+                    "ST_Transform(COALESCE(src.the_geom_4326, src.the_geom_local), 4326)"
+                )
+            elif col == "the_geom_local":
+                select_exprs.append(
+                    "ST_Transform(COALESCE(src.the_geom_local, src.the_geom_4326), :local_srid)"
+                )
+            elif col == "the_geom_point":
+                select_exprs.append(
+                    """COALESCE(src.the_geom_point, ST_Centroid(
+                        ST_Transform(COALESCE(src.the_geom_4326, src.the_geom_local), 4326)
+                    ))"""
+                )
+            else:
+                select_exprs.append(f'src."{col}"')
+
+        distinct, order_by, on_conflict = "", "", ""
+        if self.upsert:
+            key = ", ".join(f"staged.data->>'{col}'" for col in self.parser.upsert_key)
+            # a statement can not update the same row twice: keep the last version
+            distinct = f"DISTINCT ON ({key})"
+            order_by = f"ORDER BY {key}, staged.id DESC"
+            on_conflict = "ON CONFLICT ({}) DO UPDATE SET {}".format(
+                ", ".join(f'"{col}"' for col in self.parser.upsert_key),
+                ", ".join(
+                    f'"{col}" = EXCLUDED."{col}"'
+                    for col in insert_cols
+                    if col not in self.parser.upsert_key
+                ),
+            )
+        statement = f"""
+            WITH staged AS (
+                DELETE FROM api2gn.synthese_staging
+                WHERE id_parser = :id_parser
+                RETURNING id, data
+            ), src AS (
+                SELECT {distinct} r.*, staged.data AS staging_data
+                FROM staged,
+                jsonb_populate_record(
+                    NULL::gn_synthese.synthese,
+                    staged.data - CAST(:nomenclature_cols AS text[])
+                ) r
+                {order_by}
+            )
+            INSERT INTO gn_synthese.synthese ({", ".join(f'"{c}"' for c in insert_cols)})
+            SELECT {", ".join(select_exprs)}
+            FROM src
+            {" ".join(joins)}
+            {on_conflict}
+        """
+        return sa.text(statement), params
+
+    def write_chunk(self, chunk):
+        groups = {}
+        for row in chunk:
+            groups.setdefault(frozenset(row), []).append(row)
+        for columns, rows in groups.items():
+            self.copy(rows)
+            statement, params = self.merge_statement(sorted(columns))
+            db.session.execute(statement, params)
+
+
+class StagingUpsertWriter(StagingWriter):
+    upsert = True